@@ -8,4 +8,204 @@ global.r2 = function (cmd) {
     return response;
 };
 
+// reply with a json result and binary data
+function r2dwarfData(result, data) {
+    return {r2dwarfData: true, result: result, data: data};
+}
+
+// executed blocks and call targets, shipped as pointers in binary batches
+var r2dwarfCoverage = {threads: [], blocks: {}, calls: {}};
+
+function r2dwarfCoverageFlush(events) {
+    var blocks = [];
+    var calls = [];
+    Stalker.parse(events, {annotate: true, stringify: false}).forEach(function (event) {
+        var key;
+        if (event[0] === 'compile') {
+            key = event[1].toString();
+            if (!r2dwarfCoverage.blocks.hasOwnProperty(key)) {
+                r2dwarfCoverage.blocks[key] = true;
+                blocks.push(event[1], event[2]);
+            }
+        } else if (event[0] === 'call') {
+            key = event[2].toString();
+            if (!r2dwarfCoverage.calls.hasOwnProperty(key)) {
+                r2dwarfCoverage.calls[key] = true;
+                calls.push(event[2]);
+            }
+        }
+    });
+    if (blocks.length === 0 && calls.length === 0) {
+        return;
+    }
+
+    var pointers = blocks.concat(calls);
+    var buffer = Memory.alloc(pointers.length * Process.pointerSize);
+    pointers.forEach(function (pointer, i) {
+        buffer.add(i * Process.pointerSize).writePointer(pointer);
+    });
+    send('r2dwarf-coverage ' + JSON.stringify({
+        pointerSize: Process.pointerSize,
+        blocks: blocks.length / 2,
+        calls: calls.length
+    }), buffer.readByteArray(pointers.length * Process.pointerSize));
+}
+
+var r2dwarfOps = {
+    module: function (params) {
+        var module = Process.findModuleByAddress(ptr(params['address']));
+        if (module === null) {
+            return null;
+        }
+        return {
+            name: module.name,
+            base: module.base.toString(),
+            size: module.size,
+            path: module.path
+        };
+    },
+    moduleRanges: function (params) {
+        var module = Process.findModuleByAddress(ptr(params['address']));
+        if (module === null) {
+            return [];
+        }
+        return module.enumerateRanges('---').map(function (range) {
+            return {
+                base: range.base.toString(),
+                size: range.size,
+                protection: range.protection
+            };
+        });
+    },
+    moduleSymbols: function (params) {
+        var module = Process.findModuleByAddress(ptr(params['address']));
+        if (module === null) {
+            return null;
+        }
+        // compact arrays, a big library easily has tens of thousands of symbols
+        return {
+            name: module.name,
+            base: module.base.toString(),
+            size: module.size,
+            pointerSize: Process.pointerSize,
+            arch: Process.arch,
+            exports: module.enumerateExports().map(function (e) {
+                return [e.name, e.address.toString(), e.type];
+            }),
+            imports: module.enumerateImports().map(function (i) {
+                return [i.name, typeof i.slot !== 'undefined' ? i.slot.toString() : null, i.type];
+            }),
+            symbols: module.enumerateSymbols().filter(function (s) {
+                return !s.address.isNull();
+            }).map(function (s) {
+                return [s.name, s.address.toString(), s.type, s.size || 0];
+            })
+        };
+    },
+    read: function (params) {
+        return Memory.readByteArray(ptr(params['address']), params['size']);
+    },
+    range: function (params) {
+        var range = Process.findRangeByAddress(ptr(params['address']));
+        if (range === null) {
+            return null;
+        }
+        return {
+            base: range.base.toString(),
+            size: range.size,
+            protection: range.protection
+        };
+    },
+    readPages: function (params) {
+        // result has a '1' for each read only page in data, a 'w' for the writable ones and a '0' for the unreadable ones
+        var pageSize = params['pageSize'];
+        var flags = '';
+        var chunks = [];
+        var total = 0;
+        var range = null;
+        params['pages'].forEach(function (page) {
+            page = ptr(page);
+            try {
+                var chunk = Memory.readByteArray(page, pageSize);
+                if (range === null || page.compare(range.base) < 0 || page.compare(range.base.add(range.size)) >= 0) {
+                    range = Process.findRangeByAddress(page);
+                }
+                chunks.push(chunk);
+                total += chunk.byteLength;
+                flags += range !== null && range.protection.indexOf('w') >= 0 ? 'w' : '1';
+            } catch (e) {
+                flags += '0';
+            }
+        });
+        var data = new Uint8Array(total);
+        var pos = 0;
+        chunks.forEach(function (chunk) {
+            data.set(new Uint8Array(chunk), pos);
+            pos += chunk.byteLength;
+        });
+        return r2dwarfData(flags, data.buffer);
+    },
+    coverageStart: function (params) {
+        var threads = params['threads'] || Process.enumerateThreads().map(function (thread) {
+            return thread.id;
+        });
+        threads.forEach(function (threadId) {
+            if (r2dwarfCoverage.threads.indexOf(threadId) >= 0) {
+                return;
+            }
+            Stalker.follow(threadId, {
+                events: {call: true, compile: true},
+                onReceive: r2dwarfCoverageFlush
+            });
+            r2dwarfCoverage.threads.push(threadId);
+        });
+        return r2dwarfCoverage.threads.length;
+    },
+    coverageStop: function () {
+        r2dwarfCoverage.threads.forEach(function (threadId) {
+            Stalker.unfollow(threadId);
+        });
+        r2dwarfCoverage.threads = [];
+        Stalker.flush();
+        Stalker.garbageCollect();
+        // the flushed events reach r2dwarfCoverageFlush later, tell when they all went out
+        setTimeout(function () {
+            Stalker.flush();
+            setTimeout(function () {
+                send('r2dwarf-coverage-drained');
+            }, 0);
+        }, Stalker.queueDrainInterval || 250);
+        return {
+            blocks: Object.keys(r2dwarfCoverage.blocks).length,
+            calls: Object.keys(r2dwarfCoverage.calls).length
+        };
+    }
+};
+
+function r2dwarfHandler(message) {
+    recv('r2dwarf', r2dwarfHandler);
+
+    var reply = {id: message['id'], result: null, error: null};
+    var data = null;
+    try {
+        var op = r2dwarfOps[message['op']];
+        if (typeof op === 'undefined') {
+            throw new Error('unknown op ' + message['op']);
+        }
+        reply.result = op(message['params']);
+        if (reply.result !== null && reply.result instanceof ArrayBuffer) {
+            data = reply.result;
+            reply.result = data.byteLength;
+        } else if (reply.result !== null && reply.result.r2dwarfData === true) {
+            data = reply.result.data;
+            reply.result = reply.result.result;
+        }
+    } catch (e) {
+        reply.error = e.toString();
+    }
+    send('r2dwarf ' + JSON.stringify(reply), data);
+}
+
+recv('r2dwarf', r2dwarfHandler);
+
 send('r2 init ' + Process.arch);
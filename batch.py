@@ -0,0 +1,208 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from r2dwarf.src.process import R2Process, frida_arch_to_r2, quote_path
+
+# bump when the content of the reports changes, older reports are redone
+REPORT_VERSION = 1
+
+
+def _loads(data, default):
+    try:
+        return json.loads(data) if data else default
+    except ValueError:
+        return default
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_target(target):
+    # path or path@base for raw dumps, which have no headers to load them from
+    if '@' in target:
+        path, base = target.rsplit('@', 1)
+        return path, int(base, 16)
+    return target, None
+
+
+class BatchRunner:
+    def __init__(self, output_path, jobs=None, arch=None, platform='linux', decompile=False, timeout=600):
+        self.output_path = output_path
+        self.jobs = jobs or os.cpu_count() or 1
+        self.arch = arch
+        self.platform = platform
+        self.decompile = decompile
+        self.timeout = timeout
+
+        self._index_lock = threading.Lock()
+        self._index_path = os.path.join(output_path, 'index.jsonl')
+        self._done = {}
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, 'r') as f:
+            for line in f:
+                entry = _loads(line, None)
+                if entry is not None and entry.get('version') == REPORT_VERSION:
+                    self._done[entry['key']] = entry
+
+    def _key(self, sha256, base):
+        return '%s:%s:%s:%s' % (sha256, base, self.arch, self.decompile)
+
+    def run(self, targets):
+        os.makedirs(self.output_path, exist_ok=True)
+        self._load_index()
+
+        start_time = time.time()
+        done = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = dict((executor.submit(self._run_target, t), t) for t in targets)
+            for future in as_completed(futures):
+                target = futures[future]
+                try:
+                    entry, skipped = future.result()
+                except Exception as e:
+                    failed += 1
+                    print('[-] %s: %s' % (target, str(e)))
+                    continue
+                done += 1
+                if skipped:
+                    print('[=] %s: already done' % target)
+                else:
+                    print('[+] %s: %d functions in %.2fs' % (target, entry['functions'], entry['time']))
+
+        print('%d targets done, %d failed in %.2fs' % (done, failed, time.time() - start_time))
+        return failed == 0
+
+    def _run_target(self, target):
+        path, base = parse_target(target)
+        sha256 = _sha256(path)
+        key = self._key(sha256, base)
+        report_name = '%s_%s.json' % (os.path.basename(path), sha256[:12])
+
+        entry = self._done.get(key)
+        if entry is not None and os.path.exists(os.path.join(self.output_path, entry['report'])):
+            return entry, True
+
+        start_time = time.time()
+        report = self._analyze(path, base)
+        report['target'] = target
+        report['sha256'] = sha256
+
+        report_path = os.path.join(self.output_path, report_name)
+        with open(report_path + '.tmp', 'w') as f:
+            json.dump(report, f)
+        os.replace(report_path + '.tmp', report_path)
+
+        entry = {
+            'version': REPORT_VERSION,
+            'key': key,
+            'target': target,
+            'report': report_name,
+            'functions': len(report['functions']),
+            'time': time.time() - start_time
+        }
+        with self._index_lock:
+            with open(self._index_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        return entry, False
+
+    def _analyze(self, path, base):
+        # never write into the targets
+        process = R2Process(write=False).open()
+        try:
+            config = ['e scr.color=0', 'e scr.html=0', 'e scr.utf8=false', 'e anal.autoname=true',
+                      'e anal.hasnext=true', 'e asm.anal=true', 'e anal.fcnprefix=sub']
+            if self.arch is not None:
+                r2arch, r2bits = frida_arch_to_r2(self.arch)
+                config += ['e asm.arch=%s' % r2arch, 'e asm.bits=%d' % r2bits, 'e anal.arch=%s' % r2arch,
+                           'e asm.os=%s' % self.platform]
+            process.cmd('; '.join(config))
+
+            if base is None:
+                process.cmd('o %s' % quote_path(path))
+            else:
+                size = os.path.getsize(path)
+                process.cmd('on %s %s rx; e anal.from = %d; e anal.to = %d; e anal.in = raw; s %s' % (
+                    quote_path(path), hex(base), base, base + size, hex(base)))
+
+            timings = {}
+            for step in ('aa', 'aac*', 'aar'):
+                step_time = time.time()
+                process.cmd(step, timeout=self.timeout)
+                timings[step] = time.time() - step_time
+
+            report = {
+                'functions': _loads(process.cmd('aflj'), []),
+                'xrefs': _loads(process.cmd('axj'), []),
+                'strings': _loads(process.cmd('izzj', timeout=self.timeout), []),
+                'timings': timings
+            }
+            if self.decompile:
+                step_time = time.time()
+                report['decompiled'] = dict(
+                    (hex(f['offset']), process.cmd('pdc @ %s' % hex(f['offset']), timeout=self.timeout))
+                    for f in report['functions'])
+                timings['decompile'] = time.time() - step_time
+            return report
+        finally:
+            process.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='r2dwarf headless batch analysis')
+    parser.add_argument('targets', nargs='+',
+                        help='binaries or raw module dumps as path@base, @file reads targets from a file')
+    parser.add_argument('-o', '--output', default='r2dwarf_reports', help='reports directory')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='radare2 workers, default cpu count')
+    parser.add_argument('-a', '--arch', default=None, help='frida arch of raw dumps (arm, arm64, ia32, x64)')
+    parser.add_argument('-p', '--platform', default='linux', help='asm.os of raw dumps')
+    parser.add_argument('-d', '--decompile', action='store_true', help='decompile every function')
+    parser.add_argument('-t', '--timeout', type=int, default=600, help='seconds per analysis step')
+    args = parser.parse_args(argv)
+
+    targets = []
+    for target in args.targets:
+        if target.startswith('@'):
+            with open(target[1:], 'r') as f:
+                targets.extend(line.strip() for line in f if line.strip())
+        else:
+            targets.append(target)
+
+    runner = BatchRunner(args.output, jobs=args.jobs, arch=args.arch, platform=args.platform,
+                         decompile=args.decompile, timeout=args.timeout)
+    return 0 if runner.run(targets) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
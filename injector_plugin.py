@@ -17,6 +17,7 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
 import os
 
 from r2dwarf.src.pipe import R2Pipe
+from r2dwarf.src.process import frida_arch_to_r2
 
 
 class Plugin:
@@ -64,16 +65,7 @@ class Plugin:
                 parts = parts[1:]
 
                 if cmd == 'init':
-                    r2arch = parts[1]
-                    r2bits = 32
-                    if r2arch == 'arm64':
-                        r2arch = 'arm'
-                        r2bits = 64
-                    elif r2arch == 'x64':
-                        r2arch = 'x86'
-                        r2bits = 64
-                    elif r2arch == 'ia32':
-                        r2arch = 'x86'
+                    r2arch, r2bits = frida_arch_to_r2(parts[0])
                     self.pipe.cmd('e asm.arch=%s; e asm.bits=%d; e asm.os=%s; e anal.arch=%s;' % (
                         r2arch, r2bits, payload[2], r2arch))
                 else:
@@ -15,17 +15,29 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
 import os
-import json
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
-from PyQt5.QtWidgets import QDockWidget
+from PyQt5.QtWidgets import QDockWidget, QMenu
 
 from dwarf_debugger.lib import utils
+from r2dwarf.src.agent_bridge import AGENT_BRIDGE_PREFIX, R2AgentBridge
+from r2dwarf.src.bulk import R2ModuleDecompiler
+from r2dwarf.src.cache import R2DecompilerCache
+from r2dwarf.src.coverage import COVERAGE_DRAINED, COVERAGE_PREFIX, R2Coverage, R2CoverageTask
 from r2dwarf.src.decompiler import R2DecompiledText, R2Decompiler
+from r2dwarf.src.function_index import R2FunctionIndex, load_functions
 from r2dwarf.src.graph import R2Graph
 from r2dwarf.src.main_widget import R2Widget
+from r2dwarf.src.maps import DEFAULT_DISK_BUDGET, DEFAULT_MEMORY_BUDGET
+from r2dwarf.src.module import R2ModuleMapper
 from r2dwarf.src.pipe import R2Pipe
+from r2dwarf.src.process import frida_arch_to_r2
+from r2dwarf.src.prefetch import R2PrefetchCache, R2Prefetcher
+from r2dwarf.src.sharding import R2ShardedAnalysis
+from r2dwarf.src.stalls import R2StallDetector, ui_slot
+from r2dwarf.src.strings import R2StringIndexer, R2StringStore
+from r2dwarf.src.symbols import R2SymbolSync
 from dwarf_debugger.ui.panels.panel_debug import DEBUG_VIEW_MEMORY, DEBUG_VIEW_DISASSEMBLY
 from dwarf_debugger.ui.widgets.list_view import DwarfListView
 from dwarf_debugger.version import DWARF_VERSION
@@ -69,6 +81,9 @@ class Plugin:
         if ver_major > 1:
             raise Exception('Dwarf v{0} - Not supported!'.format(DWARF_VERSION))
 
+        # times the slots and the pipe calls running on the ui thread
+        self.stall_detector = R2StallDetector()
+
         self.app = app
 
         # block the creation of pipe on fatal errors
@@ -79,6 +94,15 @@ class Plugin:
         self.with_r2dec = False
         self._working = False
 
+        # bytes of target memory kept open in r2 and as map files on disk, lru maps are evicted over it
+        self.map_memory_budget = DEFAULT_MEMORY_BUDGET
+        self.map_disk_budget = DEFAULT_DISK_BUDGET
+
+        # radare2 http server doing the work instead of a local process, i.e http://analysis-box:9090
+        self.r2_remote = os.environ.get('R2DWARF_REMOTE')
+        # whole target address space visible to r2 through a local rap:// server, pages are read on demand
+        self.r2_lazy_memory = os.environ.get('R2DWARF_LAZY_MEMORY', '0') == '1'
+
         self.r2_widget = None
 
         self.debug_panel = None
@@ -88,11 +112,49 @@ class Plugin:
         self.decompiled_view = None
         self.dock_decompiled_view = None
 
+        self.r2graph = None
         self.r2decompiler = None
+        # seek shown by the graph and decompiler views, they are filled only while visible
+        self._graph_seek = None
+        self._decompiled_seek = None
+        # docks seen visible since they were last hidden
+        self._visible_views = set()
+
+        self.decompiler_cache = R2DecompilerCache()
+        self.function_index = R2FunctionIndex()
+        self.prefetch_cache = R2PrefetchCache()
+        self.r2prefetcher = None
+        self._prefetch_targets = []
+        # worker threads we are done with but still running, referenced until finished fires
+        self._retiring_threads = []
+
+        self.agent_bridge = R2AgentBridge(self)
+        self.symbol_sync = R2SymbolSync(self)
+        self.coverage = R2Coverage(self)
+        self.r2coverage_task = None
+        # strings and xrefs to them of the mapped modules, searched from the r2 widget
+        self.string_store = R2StringStore()
+        self.r2string_indexers = []
+        self.r2module_decompiler = None
+        self.r2module_mapper = None
+        self.r2sharded_analysis = None
 
         self.menu_items = []
         self._auto_sized = False
 
+        r2_menu = QMenu('r2')
+        r2_menu.addAction('Map module', self._map_module)
+        r2_menu.addAction('Map module (sharded analysis)', self._map_module_sharded)
+        r2_menu.addAction('Decompile module', self._decompile_module)
+        r2_menu.addAction('Cancel module decompilation', self._cancel_decompile_module)
+        r2_menu.addAction('Interrupt r2 command', self._interrupt_r2)
+        r2_menu.addSeparator()
+        r2_menu.addAction('Start coverage', self._start_coverage)
+        r2_menu.addAction('Stop coverage and seed analysis', self._stop_coverage)
+        r2_menu.addSeparator()
+        r2_menu.addAction('Export UI stalls (folded stacks)', self._export_stalls)
+        self.menu_items.append(r2_menu)
+
         self._seek_view_type = DEBUG_VIEW_MEMORY
 
         self.app.session_manager.sessionCreated.connect(
@@ -107,6 +169,13 @@ class Plugin:
             return None
 
         self.current_seek = ''
+        self._cancel_prefetch()
+        self.symbol_sync.reset()
+        self.coverage.reset()
+        self.function_index.clear()
+        if self.pipe is not None:
+            # the old radare2 and its watchdog go away with it
+            self.pipe.close()
         self.pipe = self._open_pipe()
 
         if self.pipe is None:
@@ -158,6 +227,8 @@ class Plugin:
             if self.pipe is None:
                 self._create_pipe()
 
+            # user navigated away, whatever we were prefetching is not interesting anymore
+            self._cancel_prefetch()
             self._working = True
 
             if self.pipe is not None:
@@ -174,6 +245,7 @@ class Plugin:
             else:
                 self._on_finish_analysis([0, bytes(), 0])
 
+    @ui_slot
     def _on_finish_analysis(self, data):
         self._working = False
         self.app.hide_progress()
@@ -187,25 +259,30 @@ class Plugin:
             if self.debug_panel.disassembly_panel.number_of_lines() == 0:
                 self.debug_panel.disassembly_panel.disasm(data[0], data[1], data[2])
         elif self._seek_view_type == DEBUG_VIEW_DISASSEMBLY:
-            # NOTE: keep the replace for compatibility
-            cmd_result = self.pipe.cmdj('afij').replace('&nbsp;', '')
             function_info = None
             num_instructions = 0
+            self._prefetch_targets = []
 
-            try:
-                function_info = json.loads(cmd_result)
-            except:
-                pass
-
-            if function_info is not None and len(function_info) > 0:
-                function_info = function_info[0]
+            if self.current_seek:
+                function_info = self.function_index.lookup(utils.parse_ptr(self.current_seek))
+            if function_info is None:
+                # not indexed yet, ask r2
+                function_info = load_functions(self.pipe, 'afij')
+                self.function_index.update(function_info)
+                function_info = function_info[0] if function_info else None
 
+            if function_info is not None:
                 if 'offset' in function_info:
                     data[2] = function_info['offset'] - data[0]
-                    num_instructions = int(self.pipe.cmd('pif~?'))
+                    if 'ninstrs' in function_info or 'ninstr' in function_info:
+                        num_instructions = function_info.get('ninstrs', function_info.get('ninstr'))
+                    else:
+                        num_instructions = int(self.pipe.cmd('pif~?'))
 
                 if 'callrefs' in function_info:
                     for ref in function_info['callrefs']:
+                        if ref['type'] == 'CALL':
+                            self._add_prefetch_target(ref['addr'], function_info.get('offset'))
                         self.call_refs_model.appendRow([
                             QStandardItem(hex(ref['addr'])),
                             QStandardItem(hex(ref['at'])),
@@ -213,6 +290,7 @@ class Plugin:
                         ])
                 if 'codexrefs' in function_info:
                     for ref in function_info['codexrefs']:
+                        self._add_prefetch_target(ref['addr'], function_info.get('offset'))
                         self.code_xrefs_model.appendRow([
                             QStandardItem(hex(ref['addr'])),
                             QStandardItem(hex(ref['at'])),
@@ -231,93 +309,163 @@ class Plugin:
 
             self.graph_view.clear()
             self.decompiled_view.clear()
-
-        self.r2graph = R2Graph(self.pipe)
-        self.r2graph.onR2Graph.connect(self._on_finish_graph)
-        self.r2graph.start()
-
-    def _on_finish_graph(self, data):
-        graph_data = data[0]
-
+            self._graph_seek = None
+            self._decompiled_seek = None
+
+        self._refresh_views()
+
+    def _is_view_visible(self, dock):
+        return dock is not None and dock.isVisible()
+
+    def _is_view_stale(self, dock):
+        if dock is self.dock_graph_view:
+            return self._graph_seek != self.current_seek
+        return self.with_r2dec and self._decompiled_seek != self.current_seek
+
+    @ui_slot
+    def _on_view_visibility_changed(self, dock, visible):
+        # tab switches and focus changes fire too, only a dock coming back with an old seek needs work
+        if not visible:
+            self._visible_views.discard(dock)
+            return
+        if dock in self._visible_views:
+            return
+        self._visible_views.add(dock)
+        if self._is_view_stale(dock):
+            self._refresh_views()
+
+    def _refresh_views(self):
+        # agf and the decompiler only run for the docks that can be seen, results are kept per seek
+        if self.pipe is None or self._working or not self.current_seek:
+            return
+
+        seek = self.current_seek
+        cached = self.prefetch_cache.get_function(utils.parse_ptr(seek)) or {}
+        pending = False
+
+        if self._is_view_visible(self.dock_graph_view) and self._graph_seek != seek:
+            if cached.get('graph') is not None:
+                self._show_graph(seek, cached['graph'])
+            else:
+                pending = True
+                if self.r2graph is None:
+                    self.r2graph = R2Graph(self.pipe, seek)
+                    self.r2graph.onR2Graph.connect(self._on_finish_graph)
+                    self.r2graph.start()
+
+        if self.with_r2dec and self._is_view_visible(self.dock_decompiled_view) and self._decompiled_seek != seek:
+            if cached.get('decompiled') is not None:
+                self._show_decompiled(seek, cached['decompiled'])
+            else:
+                pending = True
+                if self.r2decompiler is None:
+                    self.r2decompiler = R2Decompiler(
+                        self.pipe, self.with_r2dec, seek, cache=self.decompiler_cache)
+                    self.r2decompiler.onR2Decompiler.connect(self._on_finish_decompiler)
+                    self.r2decompiler.start()
+
+        if not pending:
+            self._start_prefetch()
+
+    def _show_graph(self, seek, graph_data):
+        self.graph_view.clear()
         self.graph_view.appendHtml('<pre>' + graph_data + '</pre>')
+        self._graph_seek = seek
 
-        if self.with_r2dec:
-            self.r2decompiler = R2Decompiler(self.pipe, self.with_r2dec)
-            self.r2decompiler.onR2Decompiler.connect(self._on_finish_decompiler)
-            self.r2decompiler.start()
+    def _show_decompiled(self, seek, html_lines):
+        self.decompiled_view.clear()
+        for html_line in html_lines:
+            self.decompiled_view.appendHtml(html_line)
+        self._decompiled_seek = seek
 
+    @ui_slot
+    def _on_finish_graph(self, data):
+        graph_data, seek = data
+        # still running until run() returns
+        self._retire_thread(self.r2graph)
+        self.r2graph = None
+
+        if graph_data is not None:
+            self.prefetch_cache.put_function(utils.parse_ptr(seek), graph=graph_data)
+        if seek == self.current_seek:
+            self._show_graph(seek, graph_data or '')
+        # the user may have moved meanwhile
+        self._refresh_views()
+
+    def _add_prefetch_target(self, address, function_address):
+        if address != function_address and address not in self._prefetch_targets:
+            self._prefetch_targets.append(address)
+
+    def _start_prefetch(self):
+        self._cancel_prefetch()
+
+        if self.pipe is None or not self._prefetch_targets or self.pipe.dwarf is None:
+            return
+
+        self.r2prefetcher = R2Prefetcher(self, self._prefetch_targets,
+                                         graph=self._is_view_visible(self.dock_graph_view),
+                                         decompile=self._is_view_visible(self.dock_decompiled_view))
+        self.r2prefetcher.start(QThread.IdlePriority)
+
+    def _cancel_prefetch(self):
+        if self.r2prefetcher is not None:
+            self.r2prefetcher.cancel()
+            self._retire_thread(self.r2prefetcher)
+            self.r2prefetcher = None
+
+    def _retire_thread(self, thread):
+        # a QThread collected while running takes the whole process down
+        self._retiring_threads.append(thread)
+        thread.finished.connect(lambda: self._on_thread_retired(thread))
+        if thread.isFinished():
+            self._on_thread_retired(thread)
+
+    def _on_thread_retired(self, thread):
+        if thread in self._retiring_threads:
+            self._retiring_threads.remove(thread)
+
+    @ui_slot
     def _on_finish_decompiler(self, data):
-        import re
-        # keep until ?
-        data[0] = re.sub(r'\d+;\d+;\d+;\d+;', '', data[0])
-        data[0] = data[0].replace('<', '&lt;').replace('>', '&gt;')
-        # replace colors
-        regex = r'\\u001b(\[[0-?]*[ -/]*[@-~])(.*?)\\u001b\[[0-?]*[ -/]*[@-~]'
-        decompile_data = re.sub(regex, r"<font color='\1'>\2</font>", data[0])
-
-        hex_regex = r'(0x[a-f0-9]+)'
-
-        colors = {
-            # comment == orgcolor
-            '[30m': '#666',  # black
-            '[31m': '#5C6370',  # red
-            '[32m': '#D19A66',  # green
-            '[33m': '#C678DD',  # yellow
-            '[34m': 'blue',
-            '[35m': '#C678DD',  # magenta
-            '[36m': '#e06c75',  # cyan
-            '[37m': 'white',
-            '[39m': '#666',  # white
-            '[90m': '#61AFEF',  # lightgray
-            '[91m': 'lightred',
-            '[92m': 'lightgreen'
-        }
-
-        for color in colors:
-            decompile_data = decompile_data.replace(color, colors[color])
-
-        decompile_data = json.loads(decompile_data)
-
-        if decompile_data:
-            # parse
-            if 'lines' in decompile_data and decompile_data['lines']:
-                for line in decompile_data['lines']:
-                    if 'str' in line:
-                        new_line = ''
-                        for char in line['str']:
-                            if char.isspace():
-                                new_line += '&nbsp;'
-                            else:
-                                break
-
-                        if 'offset' in line:
-                            new_line += '<a href="offset:' + \
-                                hex(line['offset']) + \
-                                '" style="color: #666; text-decoration: none;">'
-
-                        line_content = line['str'].lstrip()
-                        new_line += re.sub(
-                            hex_regex, "<a style=\"color: #8B0000; text-decoration: none;\" href=\"jump:\\1\">\\1</a>", line_content)
-
-                        if 'offset' in line:
-                            new_line += '</a>'
+        html_lines, seek = data
+        self._retire_thread(self.r2decompiler)
+        self.r2decompiler = None
 
-                        self.decompiled_view.appendHtml(new_line)
+        if html_lines:
+            self.prefetch_cache.put_function(utils.parse_ptr(seek), decompiled=html_lines)
+        if seek == self.current_seek:
+            self._show_decompiled(seek, html_lines)
+        self._refresh_views()
 
+    @ui_slot
     def _on_pipe_error(self, reason):
         should_recreate_pipe = True
 
         if 'Broken' in reason:
             should_recreate_pipe = False
+        elif self.pipe is not None and self.pipe.is_alive():
+            # the command hit its deadline or radare2 was restarted with the session replayed
+            self._log('r2: %s' % reason)
+            should_recreate_pipe = False
 
         if should_recreate_pipe:
             self._create_pipe()
 
+    @ui_slot
     def _on_receive_cmd(self, args):
         message, data = args
         if 'payload' in message:
             payload = message['payload']
-            if payload.startswith('r2 '):
+            if payload.startswith(AGENT_BRIDGE_PREFIX):
+                self.agent_bridge.on_reply(payload, data)
+            elif payload.startswith(COVERAGE_PREFIX):
+                self.coverage.on_batch(payload, data)
+            elif payload == COVERAGE_DRAINED:
+                self.coverage.on_drained()
+            elif payload.startswith('set_context') or payload.startswith('release'):
+                # breakpoint hit or thread resumed, the target may have written its memory
+                if self.pipe is not None and self.pipe.rap is not None:
+                    self.pipe.rap.cache.drop_volatile()
+            elif payload.startswith('r2 '):
                 if self.pipe is None:
                     self._create_pipe()
 
@@ -327,18 +475,11 @@ class Plugin:
                 parts = parts[1:]
 
                 if cmd == 'init':
-                    r2arch = parts[0]
-                    r2bits = 32
-                    if r2arch == 'arm64':
-                        r2arch = 'arm'
-                        r2bits = 64
-                    elif r2arch == 'x64':
-                        r2arch = 'x86'
-                        r2bits = 64
-                    elif r2arch == 'ia32':
-                        r2arch = 'x86'
+                    r2arch, r2bits = frida_arch_to_r2(parts[0])
                     self.pipe.cmd('e asm.arch=%s; e asm.bits=%d; e asm.os=%s; e anal.arch=%s;' % (
                         r2arch, r2bits, payload[2], r2arch))
+                    if self.r2_lazy_memory:
+                        self.pipe.map_process(r2bits)
                 else:
                     try:
                         result = self.pipe.cmd(cmd + ' ' + ' '.join(parts), api=True)
@@ -348,6 +489,167 @@ class Plugin:
                         self.app.dwarf._script.post(
                             {"type": 'r2', "payload": None})
 
+    def _log(self, text):
+        if self.r2_widget is not None:
+            self.r2_widget.console.log(text, time_prefix=False)
+        else:
+            print('r2: %s' % text)
+
+    def _map_module(self):
+        if self.pipe is None or not self.current_seek:
+            self._log('seek to an address inside the module to map')
+            return
+        if self.r2module_mapper is not None and self.r2module_mapper.isRunning():
+            self._log('module mapping already running')
+            return
+
+        self._working = True
+        self.r2module_mapper = R2ModuleMapper(self, self.current_seek)
+        self.r2module_mapper.onR2ModuleMapperProgress.connect(self._on_map_module_progress)
+        self.r2module_mapper.onR2ModuleMapperFinished.connect(self._on_map_module_finished)
+        self.r2module_mapper.start()
+
+    @ui_slot
+    def _on_map_module_progress(self, data):
+        done, total = data
+        self.app.show_progress('r2: reading module %d/%d' % (done, total))
+
+    @ui_slot
+    def _on_map_module_finished(self, data):
+        module, elapsed, error = data
+        self._working = False
+        self.app.hide_progress()
+        if error is not None:
+            self._log('map module: %s' % error)
+        else:
+            self._log('mapped and analyzed %s in %.2fs' % (module['name'], elapsed))
+            self._index_strings(module)
+
+    def _map_module_sharded(self):
+        if self.pipe is None or not self.current_seek:
+            self._log('seek to an address inside the module to map')
+            return
+        if self.r2sharded_analysis is not None and self.r2sharded_analysis.isRunning():
+            self._log('sharded analysis already running')
+            return
+
+        self._working = True
+        self.r2sharded_analysis = R2ShardedAnalysis(self, self.current_seek)
+        self.r2sharded_analysis.onR2ShardedAnalysisProgress.connect(self._on_sharded_analysis_progress)
+        self.r2sharded_analysis.onR2ShardedAnalysisFinished.connect(self._on_sharded_analysis_finished)
+        self.r2sharded_analysis.start()
+
+    @ui_slot
+    def _on_sharded_analysis_progress(self, data):
+        done, total = data
+        self.app.show_progress('r2: analyzed shard %d/%d' % (done, total))
+
+    @ui_slot
+    def _on_sharded_analysis_finished(self, data):
+        module, functions, elapsed, error = data
+        self._working = False
+        self.app.hide_progress()
+        if error is not None:
+            self._log('sharded analysis: %s' % error)
+        else:
+            self._log('analyzed %s in %.2fs, %d functions' % (module['name'], elapsed, functions))
+            self._index_strings(module)
+
+    def _index_strings(self, module):
+        indexer = R2StringIndexer(self, module)
+        indexer.onR2StringIndexerFinished.connect(self._on_string_index_finished)
+        self.r2string_indexers.append(indexer)
+        indexer.start(QThread.LowPriority)
+
+    @ui_slot
+    def _on_string_index_finished(self, data):
+        name, count, elapsed, loaded, error = data
+        self.r2string_indexers = [i for i in self.r2string_indexers if i.isRunning()]
+        if error is not None:
+            self._log('string index of %s: %s' % (name, error))
+        else:
+            self._log('%s %d strings of %s in %.2fs' % ('loaded' if loaded else 'indexed', count, name, elapsed))
+
+    def _decompile_module(self):
+        if self.pipe is None or not self.current_seek:
+            self._log('seek to an address inside the module to decompile')
+            return
+        if self.r2module_decompiler is not None and self.r2module_decompiler.isRunning():
+            self._log('module decompilation already running')
+            return
+
+        self.r2module_decompiler = R2ModuleDecompiler(self, self.current_seek)
+        self.r2module_decompiler.onR2ModuleDecompilerProgress.connect(self._on_decompile_module_progress)
+        self.r2module_decompiler.onR2ModuleDecompilerFinished.connect(self._on_decompile_module_finished)
+        self.r2module_decompiler.start()
+
+    def _interrupt_r2(self):
+        if self.pipe is None:
+            return
+        # sigint to radare2, the running command returns with what it has
+        self.pipe.cancel()
+
+    def _cancel_decompile_module(self):
+        if self.r2module_decompiler is None or not self.r2module_decompiler.isRunning():
+            self._log('no module decompilation running')
+            return
+        self.r2module_decompiler.cancel()
+
+    @ui_slot
+    def _on_decompile_module_progress(self, data):
+        done, total, name, elapsed = data
+        self.app.show_progress('r2: decompiled %d/%d %s (%.2fs)' % (done, total, name, elapsed))
+
+    @ui_slot
+    def _on_decompile_module_finished(self, data):
+        output_path, done, elapsed, error = data
+        self.app.hide_progress()
+        if error is not None:
+            self._log('decompile module: %s' % error)
+        else:
+            self._log('decompiled %d functions in %.2fs to %s' % (done, elapsed, output_path))
+
+    def _start_coverage(self):
+        if self.r2coverage_task is not None and self.r2coverage_task.isRunning():
+            self._log('coverage task already running')
+            return
+
+        self.r2coverage_task = R2CoverageTask(self, 'start')
+        self.r2coverage_task.onR2CoverageFinished.connect(self._on_coverage_finished)
+        self.r2coverage_task.start()
+
+    def _stop_coverage(self):
+        if self.pipe is None:
+            self._log('no r2 session')
+            return
+        if self.r2coverage_task is not None and self.r2coverage_task.isRunning():
+            self._log('coverage task already running')
+            return
+
+        self._working = True
+        self.app.show_progress('r2: loading coverage')
+        self.r2coverage_task = R2CoverageTask(self, 'load')
+        self.r2coverage_task.onR2CoverageFinished.connect(self._on_coverage_finished)
+        self.r2coverage_task.start()
+
+    @ui_slot
+    def _on_coverage_finished(self, data):
+        op, result, elapsed, error = data
+        if op == 'load':
+            self._working = False
+            self.app.hide_progress()
+        if error is not None:
+            self._log('coverage: %s' % error)
+        elif op == 'start':
+            self._log('coverage started on %d threads' % result)
+        else:
+            self._log('seeded %d functions and %d blocks from coverage in %.2fs' % (result[0], result[1], elapsed))
+
+    def _export_stalls(self):
+        path = self.stall_detector.export_folded()
+        self._log('%d ui stalls (worst %dms), stacks exported to %s' % (
+            self.stall_detector.jank, self.stall_detector.worst * 1000, path))
+
     def _on_session_created(self):
         self.app.panels_menu.addSeparator()
         self.app.panels_menu.addAction('r2', self.create_widget)
@@ -416,6 +718,9 @@ class Plugin:
 
     def _on_close_tab(self, name):
         if name == 'r2':
+            if self.r2_widget is not None:
+                # the detector outlives the tab, a closed widget must not be called anymore
+                self.stall_detector.remove_listener(self.r2_widget.update_jank_label)
             self.r2_widget = None
 
     def add_decompiler_view(self):
@@ -426,6 +731,8 @@ class Plugin:
         self.debug_panel.addDockWidget(Qt.RightDockWidgetArea, self.dock_decompiled_view)
         self.debug_panel.tabifyDockWidget(self.debug_panel.dock_disassembly_panel, self.dock_decompiled_view)
         self.app.debug_view_menu.addAction(self.dock_decompiled_view.toggleViewAction())
+        self.dock_decompiled_view.visibilityChanged.connect(
+            lambda visible: self._on_view_visibility_changed(self.dock_decompiled_view, visible))
 
     def add_graph_view(self):
         self.graph_view = R2DecompiledText(debug_panel=self.debug_panel)
@@ -435,7 +742,10 @@ class Plugin:
         self.debug_panel.addDockWidget(Qt.RightDockWidgetArea, self.dock_graph_view)
         self.debug_panel.tabifyDockWidget(self.debug_panel.dock_disassembly_panel, self.dock_graph_view)
         self.app.debug_view_menu.addAction(self.dock_graph_view.toggleViewAction())
+        self.dock_graph_view.visibilityChanged.connect(
+            lambda visible: self._on_view_visibility_changed(self.dock_graph_view, visible))
 
+    @ui_slot
     def disasm_ref_double_click(self, model, modelIndex):
         ptr = utils.parse_ptr(model.item(
             model.itemFromIndex(modelIndex).row(), 0).text())
@@ -0,0 +1,88 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import threading
+
+AGENT_BRIDGE_PREFIX = 'r2dwarf '
+
+
+class R2AgentBridgeError(Exception):
+    pass
+
+
+# request/reply channel with r2dwarfHandler in agent.js
+# replies come from frida's thread and again on the ui thread through on_reply, the first one wins.
+# requests must still be done from worker threads
+class R2AgentBridge:
+    def __init__(self, plugin):
+        self._plugin = plugin
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._pending = {}
+        self._script = None
+
+    def _post(self, message):
+        script = self._plugin.app.dwarf._script
+        if script is not self._script:
+            # radare2 reading pages from a ui thread command can't wait for the ui thread to deliver the reply
+            script.on('message', self._on_message)
+            self._script = script
+        script.post(message)
+
+    def _on_message(self, message, data):
+        if message.get('type') != 'send':
+            return
+        payload = message.get('payload')
+        if isinstance(payload, str) and payload.startswith(AGENT_BRIDGE_PREFIX):
+            self.on_reply(payload, data)
+
+    def request(self, op, params=None, timeout=30, with_data=False):
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            pending = {'event': threading.Event(), 'result': None, 'data': None, 'error': None}
+            self._pending[request_id] = pending
+
+        try:
+            self._post({'type': 'r2dwarf', 'id': request_id, 'op': op, 'params': params or {}})
+            if not pending['event'].wait(timeout):
+                raise R2AgentBridgeError('agent did not reply to %s' % op)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+        if pending['error'] is not None:
+            raise R2AgentBridgeError(pending['error'])
+        if with_data:
+            return pending['result'], pending['data']
+        return pending['result']
+
+    def on_reply(self, payload, data):
+        try:
+            reply = json.loads(payload[len(AGENT_BRIDGE_PREFIX):])
+        except ValueError:
+            return
+
+        with self._lock:
+            pending = self._pending.get(reply.get('id'))
+        if pending is None:
+            return
+
+        pending['result'] = reply.get('result')
+        pending['error'] = reply.get('error')
+        pending['data'] = data
+        pending['event'].set()
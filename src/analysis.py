@@ -16,24 +16,64 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
 """
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from r2dwarf.src.function_index import load_functions
+
+# seconds before an analysis command is interrupted
+ANALYSIS_TIMEOUT = 300
+
 
 class R2Analysis(QThread):
     onR2AnalysisFinished = pyqtSignal(list, name='onR2AnalysisFinished')
 
-    def __init__(self, pipe, info, data, offset):
+    def __init__(self, pipe, info, data, offset, full=True):
         super(R2Analysis, self).__init__()
         self._pipe = pipe
         self._info = info
         self._data = data
         self._offset = offset
+        self._full = full
 
     def run(self):
-        self._pipe.cmd('e anal.from = %d; e anal.to = %d; e anal.in = raw' % (
-            self._info.base, self._info.base + self._info.size))
+        # the ui waits for the finished signal before it lets the user move again
+        try:
+            self._analyze()
+        except Exception as e:
+            print('r2 analysis failed at %s: %s' % (hex(self._info.base), str(e)))
+        self.onR2AnalysisFinished.emit([self._info.base, self._data, self._offset])
 
-        self._pipe.cmd('aa')
-        self._pipe.cmd('aac*')
-        self._pipe.cmd('aar')
-        self._pipe.cmd('af')
+    def _analyze(self):
+        if self._full:
+            self._pipe.cmd('e anal.from = %d; e anal.to = %d; e anal.in = raw' % (
+                self._info.base, self._info.base + self._info.size))
 
-        self.onR2AnalysisFinished.emit([self._info.base, self._data, self._offset])
+            # exports and symbols known by frida, so aa starts from real function boundaries
+            symbol_sync = getattr(self._pipe.plugin, 'symbol_sync', None)
+            if symbol_sync is not None:
+                symbol_sync.seed(self._info.base, self._info.base + self._info.size)
+
+            # code the target executed goes first, the static passes then start from real functions
+            coverage = getattr(self._pipe.plugin, 'coverage', None)
+            if coverage is not None and coverage.has_seeds(self._info.base, self._info.base + self._info.size):
+                try:
+                    coverage.seed(self._info.base, self._info.base + self._info.size)
+                except Exception as e:
+                    print('r2 coverage seed failed at %s: %s' % (hex(self._info.base), str(e)))
+            self._pipe.cmd('aa', timeout=ANALYSIS_TIMEOUT)
+            self._pipe.cmd('aac*', timeout=ANALYSIS_TIMEOUT)
+            self._pipe.cmd('aar', timeout=ANALYSIS_TIMEOUT)
+            self._pipe.set_analyzed(self._info.base)
+
+        # keep the function index in sync, so the ui doesn't need to ask r2 for the function at seek
+        function_index = getattr(self._pipe.plugin, 'function_index', None)
+        if function_index is None:
+            self._pipe.cmd('af')
+        elif self._full:
+            self._pipe.cmd('af')
+            # the ui waits on this one, bounds from aflj are enough, exact lookups fall back to them
+            function_index.refresh_range(self._pipe, self._info.base, self._info.base + self._info.size,
+                                         blocks=False)
+        else:
+            seek = self._pipe.plugin.current_seek
+            if not seek or function_index.lookup(int(seek, 16)) is None:
+                self._pipe.cmd('af')
+                function_index.update(load_functions(self._pipe, 'afij'))
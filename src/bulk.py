@@ -0,0 +1,208 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from r2dwarf.src.cache import R2DWARF_HOME
+from r2dwarf.src.module import map_module
+from r2dwarf.src.process import R2Process, quote_path
+
+
+class R2WorkerPool:
+    def __init__(self, config, maps, size=None, script=None):
+        # script holds what the main pipe knows and a plain open doesn't (i.e symbols and thumb hints)
+        self.size = size or os.cpu_count() or 1
+        self._config = config
+        self._maps = maps
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._processes = []
+
+        self._script_path = None
+        if script:
+            with tempfile.NamedTemporaryFile('w', suffix='.r2', delete=False) as f:
+                f.write('\n'.join(script) + '\n')
+            self._script_path = f.name
+
+    def spawn(self):
+        process = R2Process().open()
+        process.cmd('; '.join(self._config + ['e scr.color=0', 'e scr.html=0', 'e scr.utf8=false']))
+        for base, size, path in self._maps:
+            process.cmd('on %s %s %s' % (quote_path(path), hex(base), 'rwx'))
+        if self._script_path is not None:
+            process.cmd('. %s' % quote_path(self._script_path))
+        with self._lock:
+            self._processes.append(process)
+        return process
+
+    def get(self):
+        # one radare2 per pool thread, created on first use
+        process = getattr(self._local, 'process', None)
+        if process is None:
+            process = self.spawn()
+            self._local.process = process
+        return process
+
+    def close(self):
+        with self._lock:
+            for process in self._processes:
+                process.close()
+            self._processes = []
+        if self._script_path is not None:
+            try:
+                os.remove(self._script_path)
+            except OSError:
+                pass
+            self._script_path = None
+
+
+class R2ModuleDecompiler(QThread):
+    onR2ModuleDecompilerProgress = pyqtSignal(list, name='onR2ModuleDecompilerProgress')
+    onR2ModuleDecompilerFinished = pyqtSignal(list, name='onR2ModuleDecompilerFinished')
+
+    def __init__(self, plugin, address, output_path=None, workers=None):
+        super(R2ModuleDecompiler, self).__init__()
+        self._plugin = plugin
+        self._pipe = plugin.pipe
+        self._address = address
+        self._output_path = output_path
+        self._workers = workers
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        start_time = time.time()
+        try:
+            module = self._plugin.agent_bridge.request('module', {'address': self._address})
+        except Exception as e:
+            self.onR2ModuleDecompilerFinished.emit([None, 0, 0, str(e)])
+            return
+        if module is None:
+            self.onR2ModuleDecompilerFinished.emit([None, 0, 0, 'no module at %s' % self._address])
+            return
+
+        base = int(module['base'], 16)
+        end = base + module['size']
+
+        functions = self._list_functions(base, end)
+        if not functions:
+            # module not seen yet, map and analyze it as a whole
+            try:
+                map_module(self._plugin, self._address)
+            except Exception as e:
+                self.onR2ModuleDecompilerFinished.emit([None, 0, 0, str(e)])
+                return
+            functions = self._list_functions(base, end)
+        if not functions:
+            self.onR2ModuleDecompilerFinished.emit([None, 0, 0, 'no functions found in %s' % module['name']])
+            return
+
+        output_path = self._output_path
+        if output_path is None:
+            output_path = os.path.join(R2DWARF_HOME, 'modules', '%s_%s' % (module['name'], hex(base)))
+
+        pool = None
+        total = len(functions)
+        done = 0
+        try:
+            os.makedirs(output_path, exist_ok=True)
+
+            maps = self._pipe.get_maps_in(base, end)
+            # raw bytes of the module next to the decompiled output, for diffing
+            os.makedirs(os.path.join(output_path, 'ranges'), exist_ok=True)
+            for map_base, size, path in maps:
+                self._pipe.dump_range(map_base, size, os.path.join(output_path, 'ranges', '%s.bin' % hex(map_base)))
+
+            # symbols and thumb hints of the module, a worker decompiling thumb code as arm is garbage
+            pool = R2WorkerPool(self._pipe.get_worker_config(), maps, self._workers,
+                                script=self._plugin.symbol_sync.module_script(base, end))
+            with open(os.path.join(output_path, 'index.jsonl'), 'w') as index:
+                with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                    futures = [executor.submit(self._decompile, pool, output_path, f) for f in functions]
+                    for future in as_completed(futures):
+                        if self._cancelled:
+                            for pending in futures:
+                                pending.cancel()
+                            break
+                        try:
+                            entry = future.result()
+                        except Exception as e:
+                            print('r2 decompile module: %s' % str(e))
+                            continue
+                        done += 1
+                        index.write(json.dumps(entry) + '\n')
+                        index.flush()
+                        self.onR2ModuleDecompilerProgress.emit([done, total, entry['name'], entry['time']])
+        except Exception as e:
+            self.onR2ModuleDecompilerFinished.emit([output_path, done, time.time() - start_time, str(e)])
+            return
+        finally:
+            if pool is not None:
+                pool.close()
+
+        error = 'cancelled' if self._cancelled else None
+        self.onR2ModuleDecompilerFinished.emit([output_path, done, time.time() - start_time, error])
+
+    def _list_functions(self, base, end):
+        try:
+            functions = json.loads(self._pipe.cmdj('aflj') or '[]')
+        except ValueError:
+            return []
+        return [f for f in functions if base <= f['offset'] < end]
+
+    def _decompile(self, pool, output_path, function):
+        if self._cancelled:
+            raise RuntimeError('cancelled')
+
+        process = pool.get()
+        address = hex(function['offset'])
+
+        start_time = time.time()
+        process.cmd('af @ %s' % address)
+        decompiled = process.cmd('pdcj --offset @ %s' % address)
+        elapsed = time.time() - start_time
+
+        try:
+            lines = json.loads(decompiled).get('lines', []) if decompiled else []
+        except (ValueError, AttributeError):
+            lines = []
+
+        # the source for reading, the structured lines keep the offset of each of them
+        file_name = '%s_%s' % (address, re.sub(r'[^\w.]', '_', function['name']))
+        with open(os.path.join(output_path, file_name + '.c'), 'w') as f:
+            f.write('\n'.join(line.get('str', '') for line in lines) + '\n')
+        with open(os.path.join(output_path, file_name + '.json'), 'w') as f:
+            json.dump(lines, f)
+
+        return {
+            'offset': function['offset'],
+            'name': function['name'],
+            'size': function.get('size', 0),
+            'file': file_name + '.c',
+            'lines': file_name + '.json',
+            'time': elapsed
+        }
@@ -0,0 +1,212 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+from collections import OrderedDict
+
+R2DWARF_HOME = os.path.join(os.path.expanduser('~'), '.dwarf', 'r2dwarf')
+
+# bump when the rendering of the decompiled lines or the entries change
+DECOMPILER_CACHE_VERSION = 2
+
+# config which changes the output of the decompiler
+DECOMPILER_CONFIG = ['asm.arch', 'asm.bits', 'asm.os', 'asm.cpu', 'cmd.pdc', 'scr.color', 'scr.html']
+
+# where r2pm installs the plugins, dir.plugins only has the system ones
+R2_USER_PLUGINS = os.path.join(os.path.expanduser('~'), '.local', 'share', 'radare2', 'plugins')
+
+_HEX_RE = re.compile(r'0x[0-9a-fA-F]+')
+
+
+def relocate_lines(lines, old_base, size, new_base):
+    # addresses inside the range move with it, anything else is kept as is
+    if old_base == new_base:
+        return lines
+    delta = new_base - old_base
+
+    def _relocate(match):
+        value = int(match.group(), 16)
+        if old_base <= value < old_base + size:
+            return hex(value + delta)
+        return match.group()
+    return [_HEX_RE.sub(_relocate, line) for line in lines]
+
+
+class R2DecompilerCache:
+    def __init__(self, path=None, max_entries=256, max_disk_size=64 * 1024 * 1024):
+        if path is None:
+            path = os.path.join(R2DWARF_HOME, 'decompiler')
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_size = max_disk_size
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._fingerprint = None
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError:
+            # memory only
+            self.path = None
+
+    def decompiler_fingerprint(self, pipe):
+        # ?V and cmd.pdc don't change when r2dec is updated, the core plugin listing and the
+        # installed library do. plugins don't change while dwarf runs, it's computed once
+        if self._fingerprint is not None:
+            return self._fingerprint
+
+        result = pipe._cmd_process('Lc; e dir.plugins')
+        if result is None:
+            return ''
+        lines = result.split('\n')
+        fingerprint = [line.strip() for line in lines[:-1] if 'pdd' in line or 'r2dec' in line]
+        for plugins_path in (lines[-1].strip(), R2_USER_PLUGINS):
+            try:
+                names = sorted(os.listdir(plugins_path))
+            except OSError:
+                continue
+            for name in names:
+                if not name.startswith('core_pdd') and not name.startswith('core_r2dec'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(plugins_path, name))
+                except OSError:
+                    continue
+                fingerprint.append('%s:%d:%d' % (name, stat.st_size, stat.st_mtime))
+        self._fingerprint = '\n'.join(fingerprint)
+        return self._fingerprint
+
+    def key_for(self, pipe, address):
+        # key and (base, size) of the range the key is relative to, aslr moves it on every run
+        cmd = '?v $FB @ %s; p8f @ %s; ?V' % (address, address)
+        cmd += ''.join('; e %s' % var for var in DECOMPILER_CONFIG)
+        result = pipe._cmd_process(cmd)
+        if not result:
+            return None, None
+
+        lines = result.split('\n')
+        if len(lines) < 2 or not lines[1].strip():
+            # not inside a function
+            return None, None
+
+        mapped = None
+        try:
+            function_address = int(lines[0].strip(), 16)
+            mapped = pipe.get_map(function_address)
+            content_hash = pipe.content_hash(function_address) if mapped is not None else None
+        except ValueError:
+            content_hash = None
+        if mapped is not None and content_hash is not None:
+            lines[0] = '%s+%s' % (content_hash, hex(function_address - mapped[0]))
+        else:
+            mapped = None
+
+        key = hashlib.sha1()
+        key.update(str(DECOMPILER_CACHE_VERSION).encode('utf8'))
+        key.update(self.decompiler_fingerprint(pipe).encode('utf8'))
+        for line in lines:
+            key.update(line.strip().encode('utf8'))
+            key.update(b'\0')
+        return key.hexdigest(), mapped
+
+    def get(self, key, mapped=None):
+        if key is None:
+            return None
+
+        entry = None
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                entry = self._memory[key]
+
+        if entry is None:
+            if self.path is None:
+                return None
+
+            entry_path = os.path.join(self.path, key + '.json')
+            try:
+                with open(entry_path, 'r') as f:
+                    entry = json.load(f)
+                # keep the lru order on disk by mtime
+                os.utime(entry_path, None)
+            except (OSError, ValueError):
+                return None
+            self._put_memory(key, entry)
+
+        if mapped is None:
+            return entry['lines']
+        return relocate_lines(entry['lines'], entry['base'], entry['size'], mapped[0])
+
+    def put(self, key, lines, mapped=None):
+        if key is None or lines is None:
+            return
+
+        base, size = mapped if mapped is not None else (0, 0)
+        entry = {'base': base, 'size': size, 'lines': lines}
+        self._put_memory(key, entry)
+
+        if self.path is None:
+            return
+
+        try:
+            entry_path = os.path.join(self.path, key + '.json')
+            with open(entry_path + '.tmp', 'w') as f:
+                json.dump(entry, f)
+            os.replace(entry_path + '.tmp', entry_path)
+        except OSError:
+            return
+
+        self._evict_disk()
+
+    def _put_memory(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            entry_path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total += stat.st_size
+
+        if total <= self.max_disk_size:
+            return
+
+        entries.sort()
+        for mtime, size, entry_path in entries:
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.remove(entry_path)
+                total -= size
+            except OSError:
+                pass
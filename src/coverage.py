@@ -0,0 +1,179 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import struct
+import threading
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# batches sent by r2dwarfCoverageFlush in agent.js, json header followed by the pointers as data
+COVERAGE_PREFIX = 'r2dwarf-coverage '
+# sent by coverageStop once the last batches are out
+COVERAGE_DRAINED = 'r2dwarf-coverage-drained'
+# seconds to wait for the last batches after a stop
+DRAIN_TIMEOUT = 10
+
+
+# blocks and call targets executed in the target, loaded into r2 as analysis seeds
+class R2Coverage:
+    def __init__(self, plugin):
+        self._plugin = plugin
+        self._lock = threading.Lock()
+
+        # block start -> end, call targets
+        self._blocks = {}
+        self._calls = set()
+        # what the current pipe already got
+        self._loaded_blocks = set()
+        self._loaded_calls = set()
+        self._drained = threading.Event()
+
+    def reset(self):
+        # a new pipe lost all the hints
+        with self._lock:
+            self._loaded_blocks.clear()
+            self._loaded_calls.clear()
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._calls.clear()
+            self._loaded_blocks.clear()
+            self._loaded_calls.clear()
+
+    def start(self, threads=None):
+        return self._plugin.agent_bridge.request('coverageStart', {'threads': threads})
+
+    def stop(self):
+        # batches arrive on the ui thread after the reply, wait for all of them before loading
+        self._drained.clear()
+        result = self._plugin.agent_bridge.request('coverageStop')
+        if not self._drained.wait(DRAIN_TIMEOUT):
+            print('r2 coverage: last batches not received')
+        return result
+
+    def on_drained(self):
+        self._drained.set()
+
+    def on_batch(self, payload, data):
+        try:
+            header = json.loads(payload[len(COVERAGE_PREFIX):])
+        except ValueError:
+            return
+        if data is None:
+            return
+
+        count = header['blocks'] * 2 + header['calls']
+        pointers = struct.unpack('<%d%s' % (count, 'Q' if header['pointerSize'] == 8 else 'I'),
+                                 data[:count * header['pointerSize']])
+        blocks = pointers[:header['blocks'] * 2]
+        with self._lock:
+            for i in range(0, len(blocks), 2):
+                self._blocks[blocks[i]] = blocks[i + 1]
+            self._calls.update(pointers[header['blocks'] * 2:])
+
+    def has_seeds(self, start, end):
+        with self._lock:
+            return any(start <= address < end for address in self._calls)
+
+    def seed(self, start, end):
+        # call targets become functions, blocks are flagged and added to the functions they belong to
+        pipe = self._plugin.pipe
+        with self._lock:
+            calls = sorted(a for a in self._calls if start <= a < end and a not in self._loaded_calls)
+            blocks = sorted((a, self._blocks[a]) for a in self._blocks
+                            if start <= a < end and a not in self._loaded_blocks)
+            self._loaded_calls.update(calls)
+            self._loaded_blocks.update(a for a, block_end in blocks)
+        if not calls and not blocks:
+            return False
+
+        script = ['fs coverage']
+        for address, block_end in blocks:
+            script.append('f cov.%x %d @ %s' % (address, block_end - address, hex(address)))
+        script.append('fs *')
+        for address in calls:
+            script.append('af @ %s' % hex(address))
+        pipe.run_script(script, name='coverage', journal_range=(start, end))
+
+        function_index = getattr(self._plugin, 'function_index', None)
+        if function_index is None or not blocks:
+            return True
+        function_index.refresh_range(pipe, start, end)
+
+        # blocks reached through indirect jumps (i.e switch cases) that the static pass missed
+        script = []
+        for address, block_end in blocks:
+            # not in the blocks r2 found, only in the function bounds
+            function = function_index.find(address, exact=False)
+            if function is not None:
+                script.append('afb+ %s %s %d' % (hex(function['offset']), hex(address), block_end - address))
+        pipe.run_script(script, name='coverage', journal_range=(start, end))
+        return True
+
+    def load(self):
+        # seed every range we have coverage for, ranges are mapped on the way if needed
+        with self._lock:
+            pending = sorted(set(a for a in self._calls if a not in self._loaded_calls) |
+                             set(a for a in self._blocks if a not in self._loaded_blocks))
+
+        pipe = self._plugin.pipe
+        functions = 0
+        blocks = 0
+        done_end = 0
+        for address in pending:
+            if address < done_end:
+                continue
+            if not pipe.is_mapped(address):
+                base, data, offset = pipe.dwarf.read_range(hex(address))
+                if not data:
+                    continue
+                pipe.map_range(base, data)
+            mapped = pipe.get_map(address)
+            if mapped is None:
+                continue
+            base, size = mapped
+            with self._lock:
+                functions += len([a for a in self._calls if base <= a < base + size and a not in self._loaded_calls])
+                blocks += len([a for a in self._blocks if base <= a < base + size and a not in self._loaded_blocks])
+            self.seed(base, base + size)
+            done_end = base + size
+        return functions, blocks
+
+
+class R2CoverageTask(QThread):
+    onR2CoverageFinished = pyqtSignal(list, name='onR2CoverageFinished')
+
+    def __init__(self, plugin, op):
+        super(R2CoverageTask, self).__init__()
+        self._plugin = plugin
+        self._op = op
+
+    def run(self):
+        start_time = time.time()
+        coverage = self._plugin.coverage
+        try:
+            if self._op == 'start':
+                result = coverage.start()
+            else:
+                coverage.stop()
+                result = coverage.load()
+        except Exception as e:
+            self.onR2CoverageFinished.emit([self._op, None, 0, str(e)])
+            return
+        self.onR2CoverageFinished.emit([self._op, result, time.time() - start_time, None])
@@ -14,6 +14,9 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
+import json
+import re
+
 from PyQt5.QtCore import QThread, pyqtSignal, Qt
 from PyQt5.QtGui import QCursor
 from PyQt5.QtWidgets import QPlainTextEdit, QMenu
@@ -21,17 +24,106 @@ from PyQt5.QtWidgets import QPlainTextEdit, QMenu
 from dwarf_debugger.lib import utils
 
 
+DECOMPILER_COLORS = {
+    # comment == orgcolor
+    '[30m': '#666',  # black
+    '[31m': '#5C6370',  # red
+    '[32m': '#D19A66',  # green
+    '[33m': '#C678DD',  # yellow
+    '[34m': 'blue',
+    '[35m': '#C678DD',  # magenta
+    '[36m': '#e06c75',  # cyan
+    '[37m': 'white',
+    '[39m': '#666',  # white
+    '[90m': '#61AFEF',  # lightgray
+    '[91m': 'lightred',
+    '[92m': 'lightgreen'
+}
+
+
+def render_decompiled(data):
+    html_lines = []
+    if not data:
+        return html_lines
+
+    # keep until ?
+    data = re.sub(r'\d+;\d+;\d+;\d+;', '', data)
+    data = data.replace('<', '&lt;').replace('>', '&gt;')
+    # replace colors
+    regex = r'\\u001b(\[[0-?]*[ -/]*[@-~])(.*?)\\u001b\[[0-?]*[ -/]*[@-~]'
+    decompile_data = re.sub(regex, r"<font color='\1'>\2</font>", data)
+
+    hex_regex = r'(0x[a-f0-9]+)'
+
+    for color in DECOMPILER_COLORS:
+        decompile_data = decompile_data.replace(color, DECOMPILER_COLORS[color])
+
+    try:
+        decompile_data = json.loads(decompile_data)
+    except ValueError:
+        return html_lines
+
+    if decompile_data:
+        # parse
+        if 'lines' in decompile_data and decompile_data['lines']:
+            for line in decompile_data['lines']:
+                if 'str' in line:
+                    new_line = ''
+                    for char in line['str']:
+                        if char.isspace():
+                            new_line += '&nbsp;'
+                        else:
+                            break
+
+                    if 'offset' in line:
+                        new_line += '<a href="offset:' + \
+                            hex(line['offset']) + \
+                            '" style="color: #666; text-decoration: none;">'
+
+                    line_content = line['str'].lstrip()
+                    new_line += re.sub(
+                        hex_regex, "<a style=\"color: #8B0000; text-decoration: none;\" href=\"jump:\\1\">\\1</a>", line_content)
+
+                    if 'offset' in line:
+                        new_line += '</a>'
+
+                    html_lines.append(new_line)
+    return html_lines
+
+
+def decompile_function(pipe, address, cache=None):
+    key = None
+    mapped = None
+    if cache is not None:
+        key, mapped = cache.key_for(pipe, address)
+        html_lines = cache.get(key, mapped)
+        if html_lines is not None:
+            return html_lines
+
+    html_lines = render_decompiled(pipe._cmd_process('pdcj --offset @ %s' % address))
+    if cache is not None and html_lines:
+        cache.put(key, html_lines, mapped)
+    return html_lines
+
+
 class R2Decompiler(QThread):
     onR2Decompiler = pyqtSignal(list, name='onR2Decompiler')
 
-    def __init__(self, pipe, with_r2dec):
+    def __init__(self, pipe, with_r2dec, address, cache=None):
         super(R2Decompiler, self).__init__()
         self._pipe = pipe
         self._with_r2dec = with_r2dec
+        self._address = address
+        self._cache = cache
 
     def run(self):
-        decompile_data = self._pipe.cmd('pdcj --offset')
-        self.onR2Decompiler.emit([decompile_data])
+        # always answer, the plugin only starts a new decompiler once this one reported
+        try:
+            html_lines = decompile_function(self._pipe, self._address, self._cache)
+        except Exception as e:
+            print('r2 decompiler failed at %s: %s' % (self._address, str(e)))
+            html_lines = []
+        self.onR2Decompiler.emit([html_lines or [], self._address])
 
 
 class R2DecompiledText(QPlainTextEdit):
@@ -21,6 +21,7 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem
 
 from dwarf_debugger.ui.dialogs.dialog_input import InputDialog
 from dwarf_debugger.ui.widgets.list_view import DwarfListView
+from r2dwarf.src.stalls import ui_slot
 
 
 class RefreshVars(QThread):
@@ -66,6 +67,7 @@ class EVarsList(DwarfListView):
             if not self.e_vars_refresher.isRunning():
                 self.e_vars_refresher.start()
 
+    @ui_slot
     def on_vars_refresh(self, data):
         import json
         e_vars = json.loads(data[0])
@@ -0,0 +1,218 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import threading
+
+from bisect import bisect_left, bisect_right
+
+
+# addresses per afij/afbj batch
+LOAD_BATCH_SIZE = 256
+
+
+def load_functions(pipe, cmd='aflj'):
+    result = pipe.cmdj(cmd)
+    if not result:
+        return []
+    try:
+        # NOTE: keep the replace for compatibility
+        return json.loads(result.replace('&nbsp;', ''))
+    except ValueError:
+        return []
+
+
+def _load_many(pipe, cmd):
+    # the outputs of an @@= iteration, one json document per address
+    result = pipe.cmdj(cmd)
+    documents = []
+    if not result:
+        return documents
+    result = result.replace('&nbsp;', '')
+    decoder = json.JSONDecoder()
+    pos = 0
+    while pos < len(result):
+        while pos < len(result) and result[pos].isspace():
+            pos += 1
+        if pos >= len(result):
+            break
+        try:
+            document, pos = decoder.raw_decode(result, pos)
+        except ValueError:
+            break
+        documents.append(document)
+    return documents
+
+
+def load_functions_in(pipe, start, end, blocks=True):
+    # afij and basic blocks of the functions starting in the range, without listing the whole program
+    if not blocks:
+        # a single aflj, for callers that can't wait for the per function round trips
+        return [f for f in load_functions(pipe) if start <= f.get('offset', -1) < end]
+
+    offsets = load_functions(pipe, 'aflqj')
+    if offsets and not isinstance(offsets[0], int):
+        offsets = [f['offset'] for f in offsets if 'offset' in f]
+    offsets = sorted(o for o in offsets if start <= o < end)
+
+    functions = []
+    for i in range(0, len(offsets), LOAD_BATCH_SIZE):
+        batch = ' '.join(hex(o) for o in offsets[i:i + LOAD_BATCH_SIZE])
+        infos = [info[0] for info in _load_many(pipe, 'afij @@= %s' % batch) if info]
+        blocks = _load_many(pipe, 'afbj @@= %s' % batch)
+        if len(blocks) == len(infos):
+            for info, function_blocks in zip(infos, blocks):
+                info['blocks'] = [(b['addr'], b['addr'] + b['size']) for b in function_blocks
+                                  if 'addr' in b and 'size' in b]
+        functions.extend(infos)
+    return functions
+
+
+def _function_bounds(function):
+    start = function.get('minbound', function['offset'])
+    end = function.get('maxbound', function['offset'] + function.get('size', 0))
+    # function start is what we answer with, keep it inside the bounds
+    return min(start, function['offset']), max(end, function['offset'] + 1)
+
+
+class R2FunctionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts = []
+        self._ends = []
+        self._functions = []
+        # function offset -> start bound, to find entries without a scan
+        self._by_offset = {}
+        # function offset -> sorted basic block starts and ends, when known
+        self._blocks = {}
+
+    def __len__(self):
+        return len(self._starts)
+
+    def clear(self):
+        with self._lock:
+            self._starts = []
+            self._ends = []
+            self._functions = []
+            self._by_offset = {}
+            self._blocks = {}
+
+    def rebuild(self, functions):
+        entries = []
+        for function in functions:
+            if 'offset' not in function:
+                continue
+            start, end = _function_bounds(function)
+            entries.append((start, end, function))
+        entries.sort(key=lambda e: e[0])
+
+        with self._lock:
+            self._starts = [e[0] for e in entries]
+            self._ends = [e[1] for e in entries]
+            self._functions = [e[2] for e in entries]
+            self._by_offset = dict((e[2]['offset'], e[0]) for e in entries)
+            self._blocks = {}
+            for function in self._functions:
+                self._set_blocks(function)
+
+    def _set_blocks(self, function):
+        blocks = function.pop('blocks', None)
+        if blocks:
+            blocks = sorted(blocks)
+            self._blocks[function['offset']] = ([b[0] for b in blocks], [b[1] for b in blocks])
+        else:
+            self._blocks.pop(function['offset'], None)
+
+    def update(self, functions):
+        with self._lock:
+            for function in functions:
+                if 'offset' not in function:
+                    continue
+                self._remove(function['offset'])
+                start, end = _function_bounds(function)
+                i = bisect_right(self._starts, start)
+                self._starts.insert(i, start)
+                self._ends.insert(i, end)
+                self._functions.insert(i, function)
+                self._by_offset[function['offset']] = start
+                self._set_blocks(function)
+
+    def _remove(self, offset):
+        self._blocks.pop(offset, None)
+        start = self._by_offset.pop(offset, None)
+        if start is None:
+            return False
+        i = bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._functions[i]['offset'] == offset:
+                del self._starts[i]
+                del self._ends[i]
+                del self._functions[i]
+                return True
+            i += 1
+        return False
+
+    def remove_range(self, start, end):
+        with self._lock:
+            lo = bisect_left(self._starts, start)
+            hi = bisect_left(self._starts, end)
+            removed = self._functions[lo:hi]
+            for function in removed:
+                self._by_offset.pop(function['offset'], None)
+                self._blocks.pop(function['offset'], None)
+            del self._starts[lo:hi]
+            del self._ends[lo:hi]
+            del self._functions[lo:hi]
+        return removed
+
+    def refresh_range(self, pipe, start, end, blocks=True):
+        # functions of a range just analyzed, the rest of the index is kept
+        functions = load_functions_in(pipe, start, end, blocks=blocks)
+        self.remove_range(start, end)
+        self.update(functions)
+        return functions
+
+    def _in_blocks(self, function, address):
+        blocks = self._blocks.get(function['offset'])
+        if blocks is None:
+            return True
+        starts, ends = blocks
+        i = bisect_right(starts, address) - 1
+        return i >= 0 and address < ends[i]
+
+    def find(self, address, exact=True):
+        # exact checks the basic blocks, an address in a gap between them is not part of the function
+        with self._lock:
+            i = bisect_right(self._starts, address) - 1
+            # functions can nest (i.e. a tail inside another one), look back a few entries
+            for j in range(i, max(i - 4, -1), -1):
+                if self._starts[j] <= address < self._ends[j]:
+                    if not exact or self._in_blocks(self._functions[j], address):
+                        return self._functions[j]
+        return None
+
+    def lookup(self, address):
+        return self.find(address)
+
+    def all(self):
+        with self._lock:
+            return list(self._functions)
+
+    def functions_in(self, start, end):
+        with self._lock:
+            lo = bisect_left(self._starts, start)
+            hi = bisect_left(self._starts, end)
+            return self._functions[lo:hi]
@@ -20,10 +20,11 @@ from PyQt5.QtCore import pyqtSignal, QThread
 class R2Graph(QThread):
     onR2Graph = pyqtSignal(list, name='onR2Graph')
 
-    def __init__(self, pipe):
+    def __init__(self, pipe, address):
         super(R2Graph, self).__init__()
         self._pipe = pipe
+        self._address = address
 
     def run(self):
-        graph = self._pipe.cmd('agf')
-        self.onR2Graph.emit([graph])
+        graph = self._pipe.cmd('agf @ %s' % self._address)
+        self.onR2Graph.emit([graph, self._address])
@@ -0,0 +1,76 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import threading
+
+from collections import OrderedDict
+
+from r2dwarf.src.process import quote_uri
+
+
+# what is needed to bring a new radare2 to the state of the one we lost
+class R2Journal:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config = OrderedDict()
+        # key -> (lines, range), a script recorded again with the same key replaces the old one.
+        # scripts with a range are dropped when the range leaves r2
+        self._scripts = OrderedDict()
+        self._next_key = 0
+
+    def record_cmd(self, cmd):
+        with self._lock:
+            for part in cmd.split(';'):
+                part = part.strip()
+                if not part.startswith('e ') or '=' not in part:
+                    continue
+                var, value = part[2:].split('=', 1)
+                var = var.strip()
+                # transient analysis bounds are set by every analysis, no need to keep them
+                if var.startswith('anal.from') or var.startswith('anal.to'):
+                    continue
+                self._config[var] = value.strip()
+                self._config.move_to_end(var)
+
+    def record_script(self, lines, key=None, address_range=None):
+        with self._lock:
+            if key is None:
+                self._next_key += 1
+                key = self._next_key
+            self._scripts.pop(key, None)
+            self._scripts[key] = (list(lines), address_range)
+
+    def drop_range(self, start, end):
+        with self._lock:
+            dropped = [key for key, (lines, address_range) in self._scripts.items()
+                       if address_range is not None and address_range[0] < end and address_range[1] > start]
+            for key in dropped:
+                del self._scripts[key]
+        return len(dropped)
+
+    def replay_script(self, maps=(), functions=(), seek=None):
+        with self._lock:
+            script = ['e %s=%s' % (var, value) for var, value in self._config.items()]
+            for entry in maps:
+                script.append('on %s %s %s' % (quote_uri(entry.uri), hex(entry.base), entry.perm))
+            for lines, address_range in self._scripts.values():
+                script.extend(lines)
+        # the functions found by the analysis we lost, af is way cheaper than a new aa
+        for function in functions:
+            script.append('af %s @ %s' % (function['name'], hex(function['offset'])))
+        if seek:
+            script.append('s %s' % seek)
+        return script
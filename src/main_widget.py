@@ -14,9 +14,12 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
-from PyQt5.QtWidgets import QSplitter
+from PyQt5.QtWidgets import QLabel, QSplitter, QVBoxLayout, QWidget
 
 from r2dwarf.src.e_vars_list import EVarsList
+from r2dwarf.src.pipe import CONSOLE_TIMEOUT
+from r2dwarf.src.stalls import ui_slot
+from r2dwarf.src.string_list import R2StringList
 from dwarf_debugger.ui.widgets.widget_console import DwarfConsoleWidget
 
 
@@ -31,18 +34,40 @@ class R2Widget(QSplitter):
         self.console.onCommandExecute.connect(self.on_r2_command)
 
         self.e_list = EVarsList(self.plugin)
+        self.strings_list = R2StringList(self.plugin)
 
-        self.addWidget(self.console)
+        # live count of the ui thread stalls caused by the plugin
+        self.jank_label = QLabel()
+        self.update_jank_label()
+        self.plugin.stall_detector.add_listener(self.update_jank_label)
+
+        console_container = QWidget()
+        console_layout = QVBoxLayout(console_container)
+        console_layout.setContentsMargins(0, 0, 0, 0)
+        console_layout.addWidget(self.console)
+        console_layout.addWidget(self.jank_label)
+
+        self.addWidget(console_container)
         self.addWidget(self.e_list)
+        self.addWidget(self.strings_list)
 
         self.setStretchFactor(0, 4)
         self.setStretchFactor(1, 1)
+        self.setStretchFactor(2, 2)
 
         self.refresh_e_vars_list()
 
+    def update_jank_label(self, name=None, duration=0):
+        stall_detector = self.plugin.stall_detector
+        text = 'ui stalls: %d (worst %dms)' % (stall_detector.jank, stall_detector.worst * 1000)
+        if name is not None:
+            text += ', last %s %dms' % (name, duration * 1000)
+        self.jank_label.setText(text)
+
     def refresh_e_vars_list(self):
         self.e_list.refresh_e_vars_list()
 
+    @ui_slot
     def on_r2_command(self, cmd):
         if self.plugin.pipe is None:
             self.plugin._create_pipe()
@@ -54,8 +79,10 @@ class R2Widget(QSplitter):
                 self.console.log('please wait for other works to finish', time_prefix=False)
             else:
                 try:
-                    result = self.plugin.pipe.cmd(cmd)
-                    self.console.log(result, time_prefix=False)
+                    # interrupted after the deadline, the output up to there is lost and the error is logged
+                    result = self.plugin.pipe.cmd(cmd, timeout=CONSOLE_TIMEOUT)
+                    if result is not None:
+                        self.console.log(result, time_prefix=False)
                 except BrokenPipeError:
                     self.console.log('pipe is broken. recreating...', time_prefix=False)
                     self.plugin._create_pipe()
@@ -0,0 +1,137 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import threading
+
+from collections import OrderedDict
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+DEFAULT_DISK_BUDGET = 1024 * 1024 * 1024
+
+
+class R2MapEntry:
+    def __init__(self, base, size, path, perm, uri=None):
+        self.base = base
+        self.size = size
+        self.path = path
+        self.perm = perm
+        # what r2 opened, the local path or the upload on a remote radare2
+        self.uri = uri or path
+        # sha1 of the map file, computed when first needed
+        self.content_hash = None
+        # r2 file descriptor, None while the map is closed and only the file is kept on disk
+        self.fd = None
+
+    @property
+    def end(self):
+        return self.base + self.size
+
+
+class R2MapManager:
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, disk_budget=DEFAULT_DISK_BUDGET, on_evict=None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.memory_size = 0
+        self.disk_size = 0
+
+        self._on_evict = on_evict
+        self._lock = threading.RLock()
+        # lru order, least recently used first
+        self._entries = OrderedDict()
+
+    def add(self, base, size, path, perm, fd, uri=None):
+        with self._lock:
+            entry = self._entries.get(base)
+            if entry is None:
+                entry = R2MapEntry(base, size, path, perm, uri=uri)
+                self._entries[base] = entry
+                self.disk_size += size
+            if entry.fd is None:
+                self.memory_size += size
+            if uri is not None:
+                entry.uri = uri
+            # the file may have been written again
+            entry.content_hash = None
+            entry.fd = fd
+            self._entries.move_to_end(base)
+            return entry
+
+    def get(self, base):
+        # the map starting exactly at base, opened or not
+        with self._lock:
+            return self._entries.get(base)
+
+    def contains(self, ptr, opened=True):
+        # the map holding ptr
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.base <= ptr < entry.end:
+                    if opened and entry.fd is None:
+                        return None
+                    return entry
+        return None
+
+    def touch(self, base):
+        with self._lock:
+            if base in self._entries:
+                self._entries.move_to_end(base)
+
+    def entries_in(self, start, end):
+        with self._lock:
+            return sorted([e for e in self._entries.values() if e.fd is not None and e.base < end and e.end > start],
+                          key=lambda e: e.base)
+
+    def close(self, base):
+        with self._lock:
+            entry = self._entries.get(base)
+            if entry is None or entry.fd is None:
+                return None
+            entry.fd = None
+            self.memory_size -= entry.size
+            return entry
+
+    def remove(self, base):
+        with self._lock:
+            entry = self._entries.pop(base, None)
+            if entry is None:
+                return None
+            if entry.fd is not None:
+                self.memory_size -= entry.size
+            self.disk_size -= entry.size
+            return entry
+
+    def enforce(self, pinned=()):
+        # closed maps keep their file, so a revisit only costs an 'on' until the disk budget drops them too
+        with self._lock:
+            evicted = []
+            for entry in list(self._entries.values()):
+                if self.memory_size <= self.memory_budget:
+                    break
+                if entry.fd is not None and entry.base not in pinned:
+                    fd = entry.fd
+                    self.close(entry.base)
+                    evicted.append((entry, fd, False))
+            for entry in list(self._entries.values()):
+                if self.disk_size <= self.disk_budget:
+                    break
+                if entry.fd is None and entry.base not in pinned:
+                    self.remove(entry.base)
+                    evicted.append((entry, None, True))
+
+        if self._on_evict is not None:
+            for entry, fd, drop_file in evicted:
+                self._on_evict(entry, fd, drop_file)
+        return evicted
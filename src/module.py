@@ -0,0 +1,118 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from r2dwarf.src.analysis import ANALYSIS_TIMEOUT
+
+READ_CHUNK_SIZE = 1024 * 1024
+MAX_PARALLEL_READS = 4
+
+
+def _read_chunk(bridge, address, size):
+    try:
+        result, data = bridge.request('read', {'address': hex(address), 'size': size}, with_data=True)
+    except Exception:
+        # unreadable chunk, keep the layout with zeros
+        return bytes(size)
+    if data is None or len(data) != size:
+        return bytes(size)
+    return data
+
+
+def _is_mapped(pipe, base):
+    # only our own map files count, with lazy memory r2 sees every range without them
+    entry = pipe.maps.get(base)
+    return entry is not None and entry.fd is not None
+
+
+def map_module(plugin, address, progress=None, analyze=True):
+    pipe = plugin.pipe
+    bridge = plugin.agent_bridge
+
+    module = bridge.request('module', {'address': address})
+    if module is None:
+        return None
+    ranges = bridge.request('moduleRanges', {'address': module['base']}) or []
+
+    chunks = []
+    for _range in ranges:
+        base = int(_range['base'], 16)
+        if _is_mapped(pipe, base):
+            continue
+        for offset in range(0, _range['size'], READ_CHUNK_SIZE):
+            chunks.append((base, offset, min(READ_CHUNK_SIZE, _range['size'] - offset)))
+
+    buffers = {}
+    for _range in ranges:
+        base = int(_range['base'], 16)
+        if not _is_mapped(pipe, base):
+            buffers[base] = bytearray(_range['size'])
+
+    total = len(chunks)
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_READS) as executor:
+        futures = [(chunk, executor.submit(_read_chunk, bridge, chunk[0] + chunk[1], chunk[2])) for chunk in chunks]
+        for i, (chunk, future) in enumerate(futures):
+            base, offset, size = chunk
+            buffers[base][offset:offset + size] = future.result()
+            if progress is not None:
+                progress(i + 1, total)
+
+    module_name = re.sub(r'[^\w]', '_', module['name'])
+    pipe.map_ranges([
+        (int(_range['base'], 16), bytes(buffers[int(_range['base'], 16)]), _range['protection'].replace('-', '') or 'r')
+        for _range in ranges if int(_range['base'], 16) in buffers
+    ], name=module_name)
+
+    base = int(module['base'], 16)
+    end = base + module['size']
+    plugin.symbol_sync.seed(base, end)
+    if analyze:
+        # one command, nothing can change the analysis bounds in between
+        pipe._cmd_process('e anal.from = %d; e anal.to = %d; e anal.in = raw; aa; aac*; aar' % (base, end),
+                          timeout=ANALYSIS_TIMEOUT)
+        for _range in ranges:
+            pipe.set_analyzed(int(_range['base'], 16))
+        plugin.function_index.refresh_range(pipe, base, end)
+    return module
+
+
+class R2ModuleMapper(QThread):
+    onR2ModuleMapperProgress = pyqtSignal(list, name='onR2ModuleMapperProgress')
+    onR2ModuleMapperFinished = pyqtSignal(list, name='onR2ModuleMapperFinished')
+
+    def __init__(self, plugin, address):
+        super(R2ModuleMapper, self).__init__()
+        self._plugin = plugin
+        self._address = address
+
+    def run(self):
+        start_time = time.time()
+        try:
+            module = map_module(self._plugin, self._address,
+                                lambda done, total: self.onR2ModuleMapperProgress.emit([done, total]))
+        except Exception as e:
+            self.onR2ModuleMapperFinished.emit([None, 0, str(e)])
+            return
+        if module is None:
+            self.onR2ModuleMapperFinished.emit([None, 0, 'no module at %s' % self._address])
+            return
+        self.onR2ModuleMapperFinished.emit([module, time.time() - start_time, None])
@@ -14,8 +14,14 @@ Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>
 """
+import hashlib
+import json
 import os
+import select
 import shutil
+import signal
+import socket
+import threading
 import time
 
 from PyQt5.QtCore import QObject, pyqtSignal, QThread
@@ -23,7 +29,42 @@ from PyQt5.QtCore import QObject, pyqtSignal, QThread
 from dwarf_debugger.lib import utils
 from subprocess import *
 
-from r2dwarf.src.analysis import R2Analysis
+from r2dwarf.src.analysis import ANALYSIS_TIMEOUT, R2Analysis
+from r2dwarf.src.journal import R2Journal
+from r2dwarf.src.maps import DEFAULT_DISK_BUDGET, DEFAULT_MEMORY_BUDGET, R2MapManager
+from r2dwarf.src.process import quote_path, quote_uri
+from r2dwarf.src.rap import R2RapServer
+from r2dwarf.src.remote import R2HttpTransport
+
+
+# seconds before a remote command gives up. local commands only get a deadline when asked for one,
+# i.e the background analysis with ANALYSIS_TIMEOUT
+DEFAULT_TIMEOUT = 60
+# console commands run on the ui thread, nothing can be clicked (not even the interrupt) until they return
+CONSOLE_TIMEOUT = 15
+# after the interrupt, seconds before radare2 is killed and restarted
+KILL_GRACE = 3
+# bytes in a single pr, larger reads are split
+MAX_READ_SIZE = 1024 * 1024
+# seconds a sized read waits for the rest of the reply, and idle seconds after a nul before it is a short reply
+SIZED_READ_TIMEOUT = 10
+SHORT_REPLY_IDLE = .5
+
+# config copied into the worker processes so their output matches this pipe
+WORKER_CONFIG = ['asm.arch', 'asm.bits', 'asm.os', 'asm.cpu', 'anal.arch', 'cmd.pdc',
+                 'anal.autoname', 'anal.hasnext', 'asm.anal', 'anal.fcnprefix']
+
+
+class R2PipeTimeout(Exception):
+    pass
+
+
+class R2MapError(Exception):
+    pass
+
+
+class R2PipeDesync(Exception):
+    pass
 
 
 class SimpleRangeInfo:
@@ -33,7 +74,7 @@ class SimpleRangeInfo:
 
 
 class MemoryReader(QThread):
-    onR2MemoryReaderFinish = pyqtSignal(object, bytes, int, name='onR2MemoryReaderFinish')
+    onR2MemoryReaderFinish = pyqtSignal(object, object, int, name='onR2MemoryReaderFinish')
 
     def __init__(self, pipe, hex_ptr):
         super().__init__()
@@ -45,14 +86,37 @@ class MemoryReader(QThread):
         self.read_memory()
 
     def read_memory(self):
-        base, data, offset = self.dwarf.read_range(self.hex_ptr)
+        ptr = utils.parse_ptr(self.hex_ptr)
+        try:
+            base, data, offset = self.dwarf.read_range(self.hex_ptr)
+        except Exception:
+            base, data, offset = 0, None, 0
+        if not data:
+            # target not readable (i.e running or gone), show what r2 holds for the range
+            mapped = self.pipe.get_map(ptr)
+            if mapped is None:
+                self.onR2MemoryReaderFinish.emit(SimpleRangeInfo(0, 0), bytes(), 0)
+                return
+            base, size = mapped
+            data = self.pipe.read_bytes(base, size)
+            if data is None:
+                self.onR2MemoryReaderFinish.emit(SimpleRangeInfo(0, 0), bytes(), 0)
+                return
+            # the memory panel and capstone want bytes, not a view on the pipe buffer
+            data = bytes(data)
+            offset = ptr - base
         info = SimpleRangeInfo(base, len(data))
 
-        map_path = os.path.join(self.pipe.r2_pipe_local_path, hex(info.base))
-        if not os.path.exists(map_path):
-            with open(map_path, 'wb') as f:
-                f.write(data)
-            self.pipe.cmd('on %s %s %s' % (map_path, hex(info.base), 'rwx'))
+        if self.pipe.rap is not None:
+            # r2 already sees the whole process, the fresh read just saves it the page requests
+            self.pipe.rap.cache.put_range(info.base, data)
+        else:
+            try:
+                self.pipe.map_range(info.base, data)
+            except R2MapError as e:
+                print('r2 map failed: %s' % str(e))
+                self.onR2MemoryReaderFinish.emit(SimpleRangeInfo(0, 0), bytes(), 0)
+                return
         self.onR2MemoryReaderFinish.emit(info, data, offset)
 
 
@@ -71,7 +135,31 @@ class R2Pipe(QObject):
 
         self.plugin = plugin
         self.process = None
-        self._working = False
+        # remote radare2, used instead of the process when the plugin has r2_remote
+        self.transport = None
+        # local rap server exposing the whole target address space, see map_process
+        self.rap = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # deadline of the running command, checked by the watchdog
+        self._deadline = None
+        self._running = False
+        # thread running the current command
+        self._owner = None
+        self._interrupted = False
+        self._killed = False
+        self._watchdog = None
+
+        # config, hints and scripts replayed into a restarted radare2
+        self.journal = R2Journal()
+
+        # ranges mapped into r2 and bases already analyzed
+        self.maps = R2MapManager(
+            memory_budget=getattr(plugin, 'map_memory_budget', DEFAULT_MEMORY_BUDGET),
+            disk_budget=getattr(plugin, 'map_disk_budget', DEFAULT_DISK_BUDGET),
+            on_evict=self._on_map_evicted)
+        self._analyzed = set()
 
         self._cleanup()
 
@@ -79,15 +167,15 @@ class R2Pipe(QObject):
         os.mkdir(self.r2_pipe_local_path)
 
     def _cleanup(self):
-        if os.name != 'nt':
-            utils.do_shell_command("pkill radare2")
-        else:
+        # the watchdog loop ends once it is not the pipe watchdog anymore
+        self._watchdog = None
+
+        # only our own radare2, the worker pools run their own
+        if self.process is not None and self.process.poll() is None:
             try:
-                utils.do_shell_command("taskkill /IM radare2.exe /F")
-                #utils.do_shell_command("tskill radare2")
-            except IOError as io_error:
-                if io_error.errno == 2:
-                    print('error: cant execute tskill')
+                self.process.kill()
+            except OSError:
+                pass
 
         for path in os.listdir('.'):
             if '.r2pipe' in path:
@@ -98,44 +186,162 @@ class R2Pipe(QObject):
                     pass
 
     def close(self):
+        self._closed = True
+        if self.transport is not None:
+            self.transport.close()
+        if self.rap is not None:
+            self.rap.close()
         self._cleanup()
 
     def open(self):
+        remote = getattr(self.plugin, 'r2_remote', None)
+        try:
+            if remote:
+                self.transport = R2HttpTransport(remote, timeout=DEFAULT_TIMEOUT).open()
+                return
+            self._spawn()
+        except Exception as e:
+            self.onPipeBroken.emit(str(e))
+            return
+
+        self._watchdog = threading.Thread(target=self._watchdog_loop, daemon=True)
+        self._watchdog.start()
+
+    def _spawn(self):
         r2e = 'radare2'
 
         if os.name == 'nt':
             r2e += '.exe'
         cmd = [r2e, "-w", "-q0", '-']
-        try:
-            self.process = Popen(cmd, shell=False, stdin=PIPE, stdout=PIPE, stderr=PIPE, bufsize=0)
-        except Exception as e:
-            self.onPipeBroken.emit(str(e))
+        # stderr is never read, a pipe would fill up and hang radare2
+        self.process = Popen(cmd, shell=False, stdin=PIPE, stdout=PIPE, stderr=DEVNULL, bufsize=0)
         self.process.stdout.read(1)
 
-    def cmd(self, cmd, api=False):
+    def is_alive(self):
+        if self.transport is not None:
+            return self.transport.is_alive()
+        return self.process is not None and self.process.poll() is None
+
+    def cancel(self, owner=None):
+        # interrupt the running command, if any. with owner only if that thread runs it
+        if self._running and (owner is None or self._owner == owner):
+            self._deadline = time.time()
+
+    def _watchdog_loop(self):
+        while not self._closed and self._watchdog is threading.current_thread():
+            time.sleep(.1)
+            deadline = self._deadline
+            process = self.process
+            if deadline is None or process is None or time.time() < deadline:
+                continue
+
+            if not self._interrupted and os.name != 'nt':
+                # r2 handles sigint as a break, long analysis stops and the command returns
+                self._interrupted = True
+                try:
+                    process.send_signal(signal.SIGINT)
+                except OSError:
+                    pass
+            elif time.time() > deadline + KILL_GRACE or os.name == 'nt':
+                if not self._killed:
+                    self._killed = True
+                    try:
+                        process.kill()
+                    except OSError:
+                        pass
+
+    def restart(self):
+        if self.transport is not None:
+            # a remote radare2 is not ours to restart
+            return
+        with self._lock:
+            self._restart()
+
+    def _restart(self):
+        # called with the lock held
+        try:
+            if self.process is not None and self.process.poll() is None:
+                self.process.kill()
+        except OSError:
+            pass
+
+        start_time = time.time()
+        self._spawn()
+
+        function_index = getattr(self.plugin, 'function_index', None)
+        script = self.journal.replay_script(
+            maps=self.maps.entries_in(0, 1 << 64),
+            functions=function_index.all() if function_index is not None else (),
+            seek=self.plugin.current_seek)
+        script_path = os.path.join(self.r2_pipe_local_path, 'replay_%d.r2' % (time.time() * 1000))
+        with open(script_path, 'w') as f:
+            f.write('\n'.join(script) + '\n')
+        self._execute('. %s' % quote_path(script_path), timeout=ANALYSIS_TIMEOUT)
+        os.remove(script_path)
+
+        try:
+            files = json.loads(str(self._execute('e scr.html=0; oj; e scr.html=1'), 'utf-8', errors='ignore') or '[]')
+            fds = dict((f['uri'], f['fd']) for f in files if 'uri' in f and 'fd' in f)
+        except ValueError:
+            fds = {}
+        for entry in self.maps.entries_in(0, 1 << 64):
+            entry.fd = fds.get(entry.uri)
+        print('r2pipe restarted and replayed %d commands in %.2fs' % (len(script), time.time() - start_time))
+
+    def cmd(self, cmd, api=False, timeout=None):
         try:
-            ret = self._cmd_process(cmd)
+            ret = self._cmd_process(cmd, timeout=timeout)
             if cmd.startswith('s') and len(cmd) > 1:
                 new_seek = self._cmd_process('s')
                 self.plugin.current_seek = new_seek
                 self.map_ptr(new_seek, sync=api)
             elif cmd.startswith('e '):
+                self.journal.record_cmd(cmd)
                 self.onUpdateVars.emit()
             return ret
         except Exception as e:
             print('r2pipe broken: %s' % str(e))
-            self._working = False
             self.onPipeBroken.emit(str(e))
         return None
 
+    def run_script(self, lines, name='script', journal=True, timeout=None, journal_key=None, journal_range=None):
+        # many commands in a single round trip. journaled scripts are replayed on restart,
+        # the last one recorded with a journal_key replaces the previous ones and
+        # the ones recorded with a journal_range are dropped when the range is evicted
+        if not lines:
+            return None
+        if self.transport is not None:
+            # the remote radare2 can't see our files, the script goes in the request body
+            ret = self._cmd_process('\n'.join(lines), timeout=timeout)
+            if journal:
+                self.journal.record_script(lines, key=journal_key, address_range=journal_range)
+            return ret
+        script_path = os.path.join(self.r2_pipe_local_path, '%s_%d.r2' % (name, time.time() * 1000))
+        with open(script_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        try:
+            ret = self._cmd_process('. %s' % quote_path(script_path), timeout=timeout)
+        finally:
+            os.remove(script_path)
+        if journal:
+            self.journal.record_script(lines, key=journal_key, address_range=journal_range)
+        return ret
+
     def cmdj(self, cmd):
-        self.cmd('e scr.html=0')
-        ret = self.cmd(cmd)
-        self.cmd('e scr.html=1')
+        # single round trip, so other threads can't run commands with html disabled
         try:
-            return ret
-        except:
-            return None
+            return self._cmd_process('e scr.html=0; %s; e scr.html=1' % cmd)
+        except Exception as e:
+            print('r2pipe broken: %s' % str(e))
+            self.onPipeBroken.emit(str(e))
+        return None
+
+    def get_worker_config(self):
+        values = self._cmd_process('; '.join('e %s' % var for var in WORKER_CONFIG))
+        if values is None:
+            return []
+        values = values.split('\n')
+        return ['e %s=%s' % (var, value.strip()) for var, value in zip(WORKER_CONFIG, values)]
 
     def map_ptr(self, hex_ptr, sync=False):
         self.plugin._working = True
@@ -152,47 +358,354 @@ class R2Pipe(QObject):
             #_range = self.plugin._script.exports.api(0, 'getRange', [hex_ptr])
             pass
 
+    def map_process(self, bits):
+        # radare2 reads the pages it touches from the agent, instead of copies of whole ranges
+        if self.rap is not None or self.transport is not None or self.dwarf is None:
+            return
+        self.rap = R2RapServer(self.plugin, (1 << bits) if bits < 64 else (1 << 48))
+        self.rap.start()
+        self.run_script(['on %s 0x0 r' % quote_uri(self.rap.uri)], name='rap')
+
+    def map_range(self, base, data, perm='rwx'):
+        self.map_ranges([(base, data, perm)])
+
+    def map_ranges(self, ranges, name=None):
+        # ranges is a list of (base, data, perm), all loaded into r2 with a single script
+        script = []
+        paths = {}
+        for i, (base, data, perm) in enumerate(ranges):
+            entry = self.maps.get(base)
+            if entry is not None and entry.fd is not None:
+                self.maps.touch(base)
+                continue
+            map_path = os.path.join(self.r2_pipe_local_path, hex(base))
+            if entry is None or not os.path.exists(map_path):
+                with open(map_path, 'wb') as f:
+                    f.write(data)
+            if self.transport is not None:
+                # the local file stays for the worker processes
+                uri = entry.uri if entry is not None and entry.uri != entry.path else \
+                    self.transport.upload('%s_%s' % (os.path.basename(self.r2_pipe_local_path), hex(base)), data)
+            else:
+                uri = map_path
+            script.append('on %s %s %s' % (quote_uri(uri), hex(base), perm))
+            if name is not None:
+                script.append('omn %s %s.%d.%s' % (hex(base), name, i, perm))
+            paths[uri] = (base, len(data), perm, map_path)
+
+        if not script:
+            return
+
+        if len(script) == 1:
+            self._cmd_process(script[0])
+        else:
+            # maps are replayed from the map manager on restart
+            self.run_script(script, name='map', journal=False)
+
+        fds = self._get_fds()
+        missing = [uri for uri in paths if uri not in fds]
+        if missing:
+            # open once more, a map without fd could never be closed on eviction
+            self.run_script(['on %s %s %s' % (quote_uri(uri), hex(paths[uri][0]), paths[uri][2]) for uri in missing],
+                            name='map', journal=False)
+            fds = self._get_fds()
+            missing = [uri for uri in paths if uri not in fds]
+            if missing:
+                raise R2MapError('r2 did not open %s' % ', '.join(missing))
+        for uri in paths:
+            base, size, perm, map_path = paths[uri]
+            self.maps.add(base, size, map_path, perm, fds.get(uri), uri=uri)
+        self.maps.enforce(pinned=set(base for base, size, perm, map_path in paths.values()))
+
+    def _get_fds(self):
+        try:
+            files = json.loads(self._cmd_process('e scr.html=0; oj; e scr.html=1') or '[]')
+        except ValueError:
+            return {}
+        return dict((f['uri'], f['fd']) for f in files if 'uri' in f and 'fd' in f)
+
+    def _on_map_evicted(self, entry, fd, drop_file):
+        if fd is not None:
+            # drop everything r2 knows about the range, it will be mapped and analyzed again on next visit
+            script = ['o-%d' % fd]
+            function_index = getattr(self.plugin, 'function_index', None)
+            if function_index is not None:
+                for function in function_index.remove_range(entry.base, entry.end):
+                    script.append('af- %s' % hex(function['offset']))
+            self._cmd_process('; '.join(script))
+            self._analyzed.discard(entry.base)
+            # hints and seeds for the range are made again when it is analyzed again
+            self.journal.drop_range(entry.base, entry.end)
+
+            prefetch_cache = getattr(self.plugin, 'prefetch_cache', None)
+            if prefetch_cache is not None:
+                prefetch_cache.drop_range(entry.base, entry.end)
+        if drop_file:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            if self.transport is not None and entry.uri.startswith('gzip://'):
+                self._cmd_process('rm %s' % entry.uri[len('gzip://'):])
+
+    def get_map(self, ptr):
+        entry = self.maps.contains(ptr)
+        if entry is None:
+            if self.rap is not None:
+                return self.rap.get_range(ptr)
+            return None
+        self.maps.touch(entry.base)
+        return entry.base, entry.size
+
+    def content_hash(self, ptr):
+        entry = self.maps.contains(ptr, opened=False)
+        if entry is None:
+            return None
+        if entry.content_hash is None:
+            digest = hashlib.sha1()
+            try:
+                with open(entry.path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+            except OSError:
+                return None
+            entry.content_hash = digest.hexdigest()
+        return entry.content_hash
+
+    def get_maps_in(self, start, end):
+        return [(e.base, e.size, e.path) for e in self.maps.entries_in(start, end)]
+
+    def is_mapped(self, ptr):
+        if self.maps.contains(ptr) is not None:
+            return True
+        return self.rap is not None and self.rap.get_range(ptr) is not None
+
+    def is_analyzed(self, base):
+        return base in self._analyzed
+
+    def set_analyzed(self, base):
+        self._analyzed.add(base)
+
     def memmap(self, info, data, offset):
-        if info is None or data is None:
-            self.plugin._on_finish_analysis([info.base, data, offset])
+        if info is None or not data:
+            self.plugin._on_finish_analysis([0, bytes(), 0])
         else:
             self.plugin.app.show_progress('r2: running analysis at %s' % hex(info.base))
             self.plugin._working = True
 
-            self.r2analysis = R2Analysis(self, info, data, offset)
+            self.r2analysis = R2Analysis(self, info, data, offset, full=not self.is_analyzed(info.base))
             self.r2analysis.onR2AnalysisFinished.connect(self.plugin._on_finish_analysis)
             self.r2analysis.start()
 
-    def _cmd_process(self, cmd):
-        if not self.process:
-            return
+    def cmd_bytes(self, cmd, size=None):
+        # raw response, no decode and no copy. with size the read is binary safe (i.e pr/p8 with a known length)
+        try:
+            return self._cmd_process_raw(cmd, size=size)
+        except Exception as e:
+            print('r2pipe broken: %s' % str(e))
+            self.onPipeBroken.emit(str(e))
+        return None
 
-        while self._working:
-            time.sleep(.1)
+    def _read_cmd(self, address, size):
+        # scr.html is on for the ui, pr would print the bytes html escaped
+        return 'e scr.html=0; pr %d @ %s; e scr.html=1' % (size, hex(address))
 
-        self._working = True
+    def _read_chunks(self, address, size):
+        chunks = [(address + offset, min(MAX_READ_SIZE, size - offset)) for offset in range(0, size, MAX_READ_SIZE)]
+        return self.cmd_many([self._read_cmd(a, s) for a, s in chunks], sizes=[s for a, s in chunks])
 
-        cmd = cmd.strip().replace("\n", ";")
-        self.process.stdin.write((cmd + '\n').encode('utf8'))
-        self.process.stdin.flush()
+    def read_bytes(self, address, size):
+        try:
+            data = self._read_chunks(address, size)
+        except Exception as e:
+            print('r2pipe broken: %s' % str(e))
+            self.onPipeBroken.emit(str(e))
+            return None
+        return data[0] if len(data) == 1 else b''.join(data)
 
-        output = b''
-        while True:
+    def dump_range(self, address, size, path, chunk_size=MAX_READ_SIZE):
+        entry = self.maps.contains(address, opened=False)
+        if entry is not None and address + size <= entry.end:
+            # the bytes r2 works on are in the map file already
             try:
-                result = self.process.stdout.read(4096)
-            except:
-                continue
-            if result:
-                if result.endswith(b'\0'):
-                    output += result[:-1]
-                    break
+                if address == entry.base and size == entry.size:
+                    shutil.copyfile(entry.path, path)
+                else:
+                    with open(entry.path, 'rb') as src, open(path, 'wb') as f:
+                        src.seek(address - entry.base)
+                        remaining = size
+                        while remaining > 0:
+                            chunk = src.read(min(chunk_size, remaining))
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            remaining -= len(chunk)
+                return True
+            except OSError as e:
+                print('r2 map file not copied: %s' % str(e))
+
+        try:
+            data = self._read_chunks(address, size)
+        except Exception as e:
+            print('r2pipe broken: %s' % str(e))
+            self.onPipeBroken.emit(str(e))
+            return False
+        with open(path, 'wb') as f:
+            for chunk in data:
+                f.write(chunk)
+        return True
+
+    def cmd_many(self, cmds, sizes=None):
+        # independent commands, raw results in order. sent in parallel to a remote radare2
+        if sizes is None:
+            sizes = [None] * len(cmds)
+        if self.transport is not None:
+            outputs = self.transport.cmd_parallel(cmds, timeout=DEFAULT_TIMEOUT)
+            return [memoryview(o)[:s] if s is not None else memoryview(o) for o, s in zip(outputs, sizes)]
+        return [self._cmd_process_raw(cmd, size=size) for cmd, size in zip(cmds, sizes)]
+
+    def _cmd_process_raw(self, cmd, size=None, timeout=None):
+        # pipe calls on the ui thread show up in the stall detector with the command name
+        stall_detector = getattr(self.plugin, 'stall_detector', None)
+        if stall_detector is None:
+            return self._cmd_process_locked(cmd, size=size, timeout=timeout)
+        with stall_detector.timed('r2 %s' % cmd.strip().split(' ')[0]):
+            return self._cmd_process_locked(cmd, size=size, timeout=timeout)
+
+    def _cmd_process_locked(self, cmd, size=None, timeout=None):
+        if self.transport is not None:
+            # nothing to restart on our side, errors go up to onPipeBroken
+            with self._lock:
+                return self._execute_remote(cmd, size=size, timeout=timeout)
+
+        if not self.process:
+            return None
 
-                output += result
+        # the pipe is shared between the ui and the worker threads
+        with self._lock:
+            try:
+                return self._execute(cmd, size=size, timeout=timeout)
+            except R2PipeTimeout:
+                if not self.is_alive():
+                    self._restart()
+                raise
+            except (BrokenPipeError, OSError):
+                if self._closed:
+                    raise
+                # radare2 died under us, bring up a new one with the same state
+                self._restart()
+                raise
+
+    def _execute(self, cmd, size=None, timeout=None):
+        # called with the lock held
+        self._interrupted = False
+        self._killed = False
+        self._deadline = time.time() + timeout if timeout else None
+        self._owner = threading.get_ident()
+        self._running = True
+        try:
+            cmd = cmd.strip().replace("\n", ";")
+            self.process.stdin.write((cmd + '\n').encode('utf8'))
+            self.process.stdin.flush()
+
+            if size is not None:
+                if size > MAX_READ_SIZE:
+                    raise ValueError('r2 sized read of %d bytes, max is %d' % (size, MAX_READ_SIZE))
+                # the exact amount of bytes plus the terminator, read straight into the buffer
+                output = bytearray(size + 1)
+                view = memoryview(output)
+                pos = 0
+                read_deadline = time.time() + (timeout or SIZED_READ_TIMEOUT)
+                last_read = time.time()
+                while pos < size + 1:
+                    if os.name != 'nt' and not select.select([self.process.stdout], [], [], .05)[0]:
+                        self._check_alive(cmd)
+                        now = time.time()
+                        if now > read_deadline or (pos and output[pos - 1] == 0 and now - last_read > SHORT_REPLY_IDLE):
+                            self._abort_sized_read(cmd, output, pos)
+                        continue
+                    read = self.process.stdout.readinto(view[pos:])
+                    if read:
+                        pos += read
+                        last_read = time.time()
+                    else:
+                        self._check_alive(cmd)
+                        time.sleep(0.001)
+                if output[size] != 0:
+                    # r2 printed something else than asked, drop the rest of the reply so the next command is in sync
+                    self._resync(cmd)
+                    raise R2PipeDesync('r2 reply to %s is not %d bytes' % (cmd, size))
+                output = view[:size]
             else:
+                output = bytearray()
+                while True:
+                    result = self.process.stdout.read(4096)
+                    if result:
+                        if result.endswith(b'\0'):
+                            output += result[:-1]
+                            break
+
+                        output += result
+                    else:
+                        self._check_alive(cmd)
+                        time.sleep(0.001)
+                output = memoryview(output)
+        finally:
+            self._running = False
+            self._owner = None
+            self._deadline = None
+
+        if self._interrupted:
+            raise R2PipeTimeout('r2 command interrupted after deadline: %s' % cmd)
+        return output
+
+    def _abort_sized_read(self, cmd, output, pos):
+        # called with the lock held
+        if pos and output[pos - 1] == 0:
+            # a shorter reply (i.e an error line), the terminator is read and the pipe is in sync
+            raise R2PipeTimeout('r2 reply to %s is %d bytes, less than asked' % (cmd, pos - 1))
+        # r2 stopped in the middle of the reply, nothing else will be in sync with it
+        self._killed = True
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+        raise R2PipeTimeout('r2 killed, reply to %s incomplete after deadline' % cmd)
+
+    def _resync(self, cmd):
+        # called with the lock held, reads up to the terminator of the current reply
+        while True:
+            result = self.process.stdout.read(1)
+            if result == b'\0':
+                return
+            if not result:
+                self._check_alive(cmd)
                 time.sleep(0.001)
 
-        self._working = False
-        output = output.decode('utf-8', errors='ignore')
+    def _execute_remote(self, cmd, size=None, timeout=None):
+        cmd = cmd.strip().replace("\n", ";")
+        try:
+            output = memoryview(self.transport.cmd(cmd, timeout=timeout or DEFAULT_TIMEOUT))
+        except socket.timeout:
+            raise R2PipeTimeout('r2 remote command timed out: %s' % cmd)
+        if size is not None:
+            return output[:size]
+        return output
+
+    def _check_alive(self, cmd):
+        if self.process.poll() is None:
+            return
+        if self._killed:
+            raise R2PipeTimeout('r2 killed after deadline: %s' % cmd)
+        raise BrokenPipeError('radare2 exited with %d' % self.process.returncode)
+
+    def _cmd_process(self, cmd, timeout=None):
+        output = self._cmd_process_raw(cmd, timeout=timeout)
+        if output is None:
+            return None
+
+        output = str(output, 'utf-8', errors='ignore')
         if output.endswith('\n'):
             output = output[:-1]
         return output
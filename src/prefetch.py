@@ -0,0 +1,145 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import threading
+import time
+
+from collections import OrderedDict
+
+from PyQt5.QtCore import QThread
+
+from r2dwarf.src.decompiler import decompile_function
+from r2dwarf.src.function_index import load_functions
+
+
+# graph and decompiler results per function. target memory is never kept here, it changes while the target runs
+class R2PrefetchCache:
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.budget = budget
+        self.size = 0
+
+        self._lock = threading.Lock()
+        self._functions = OrderedDict()
+
+    def _evict(self):
+        while self.size > self.budget and self._functions:
+            _, entry = self._functions.popitem(last=False)
+            self.size -= entry['size']
+
+    def is_full(self):
+        return self.size >= self.budget
+
+    def drop_range(self, start, end):
+        with self._lock:
+            for address in [a for a in self._functions if start <= a < end]:
+                self.size -= self._functions.pop(address)['size']
+
+    def put_function(self, address, graph=None, decompiled=None):
+        # results computed separately are merged, a view only computes what it shows
+        with self._lock:
+            old = self._functions.pop(address, None)
+            if old is not None:
+                self.size -= old['size']
+                graph = graph if graph is not None else old['graph']
+                decompiled = decompiled if decompiled is not None else old['decompiled']
+            size = len(graph or '') + sum(len(line) for line in decompiled or [])
+            self._functions[address] = {'graph': graph, 'decompiled': decompiled, 'size': size}
+            self.size += size
+            self._evict()
+
+    def get_function(self, address):
+        with self._lock:
+            entry = self._functions.get(address)
+            if entry is not None:
+                self._functions.move_to_end(address)
+            return entry
+
+    def has_function(self, address):
+        with self._lock:
+            return address in self._functions
+
+    def clear(self):
+        with self._lock:
+            self._functions.clear()
+            self.size = 0
+
+
+class R2Prefetcher(QThread):
+    def __init__(self, plugin, targets, max_targets=8, graph=True, decompile=True):
+        super(R2Prefetcher, self).__init__()
+        self._plugin = plugin
+        self._pipe = plugin.pipe
+        self._cache = plugin.prefetch_cache
+        self._targets = targets[:max_targets]
+        # only for the views that are shown
+        self._graph = graph
+        self._decompile = decompile
+        self._cancelled = False
+        self._thread_id = None
+
+    def cancel(self):
+        self._cancelled = True
+        if self._thread_id is not None:
+            # only our own command, the one of the ui may be the one running
+            self._pipe.cancel(owner=self._thread_id)
+
+    def _wait_idle(self):
+        # the user work always wins, we only use the pipe while nothing else is running
+        while self._plugin._working and not self._cancelled:
+            time.sleep(.05)
+        return not self._cancelled
+
+    def run(self):
+        self._thread_id = threading.get_ident()
+        for address in self._targets:
+            if self._cancelled or self._cache.is_full():
+                break
+            if self._cache.has_function(address):
+                continue
+            try:
+                self._prefetch(address)
+            except Exception as e:
+                if not self._cancelled:
+                    print('r2 prefetch failed at %s: %s' % (hex(address), str(e)))
+
+    def _prefetch(self, address):
+        hex_ptr = hex(address)
+
+        if not self._wait_idle():
+            return False
+        if not self._pipe.is_mapped(address):
+            base, data, offset = self._pipe.dwarf.read_range(hex_ptr)
+            if not data:
+                return False
+            self._pipe.map_range(base, data)
+
+        # only the function itself, the range analysis runs when the user gets there
+        if not self._wait_idle():
+            return False
+        self._pipe._cmd_process('af @ %s' % hex_ptr)
+        self._plugin.function_index.update(load_functions(self._pipe, 'afij @ %s' % hex_ptr))
+        graph = self._pipe._cmd_process('agf @ %s' % hex_ptr) if self._graph else None
+
+        decompiled = None
+        if self._plugin.with_r2dec and self._decompile:
+            if not self._wait_idle():
+                return False
+            decompiled = decompile_function(self._pipe, hex_ptr, self._plugin.decompiler_cache)
+
+        if self._cancelled:
+            return False
+        self._cache.put_function(address, graph, decompiled)
+        return True
@@ -0,0 +1,115 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import os
+import threading
+import time
+
+from subprocess import Popen, PIPE, DEVNULL
+
+
+def frida_arch_to_r2(arch):
+    # frida Process.arch to r2 asm.arch and asm.bits
+    r2arch = arch
+    r2bits = 32
+    if r2arch == 'arm64':
+        r2arch = 'arm'
+        r2bits = 64
+    elif r2arch == 'x64':
+        r2arch = 'x86'
+        r2bits = 64
+    elif r2arch == 'ia32':
+        r2arch = 'x86'
+    return r2arch, r2bits
+
+
+def quote_path(path):
+    # o and on split their arguments on spaces unless quoted
+    return '"%s"' % path.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def quote_uri(uri):
+    # local files are quoted, the uris we build (rap://, gzip:// uploads) have no spaces and go as they are
+    if '://' in uri:
+        return uri
+    return quote_path(uri)
+
+
+# a plain radare2 process for the workers, which don't need any of the plugin state
+class R2Process:
+    def __init__(self, args=None, write=True):
+        self.args = args or []
+        self.write = write
+        self.process = None
+
+    def open(self):
+        r2e = 'radare2'
+
+        if os.name == 'nt':
+            r2e += '.exe'
+        cmd = [r2e] + (["-w"] if self.write else []) + ["-q0"] + self.args + ['-']
+        self.process = Popen(cmd, shell=False, stdin=PIPE, stdout=PIPE, stderr=DEVNULL, bufsize=0)
+        self.process.stdout.read(1)
+        return self
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b'q!\n')
+            self.process.stdin.flush()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+    def cmd(self, cmd, timeout=None):
+        if self.process is None:
+            return None
+
+        cmd = cmd.strip().replace("\n", ";")
+        self.process.stdin.write((cmd + '\n').encode('utf8'))
+        self.process.stdin.flush()
+
+        # workers are disposable, on deadline just kill them
+        watchdog = None
+        if timeout is not None:
+            watchdog = threading.Timer(timeout, self.process.kill)
+            watchdog.daemon = True
+            watchdog.start()
+
+        output = b''
+        try:
+            while True:
+                result = self.process.stdout.read(4096)
+                if result:
+                    if result.endswith(b'\0'):
+                        output += result[:-1]
+                        break
+
+                    output += result
+                elif self.process.poll() is not None:
+                    raise BrokenPipeError('radare2 exited with %d running %s' % (self.process.returncode, cmd))
+                else:
+                    time.sleep(0.001)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+        output = output.decode('utf-8', errors='ignore')
+        if output.endswith('\n'):
+            output = output[:-1]
+        return output
@@ -0,0 +1,240 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import socket
+import struct
+import threading
+
+from collections import OrderedDict
+
+RAP_OPEN = 1
+RAP_READ = 2
+RAP_WRITE = 3
+RAP_SEEK = 4
+RAP_CLOSE = 5
+RAP_SYSTEM = 6
+RAP_CMD = 7
+RAP_REPLY = 0x80
+
+PAGE_SIZE = 4096
+# pages read after the requested ones once reads are sequential, the window doubles up to the max
+MIN_READ_AHEAD = 4
+MAX_READ_AHEAD = 64
+# pages in a single agent request
+MAX_BATCH_PAGES = 256
+PAGE_READ_TIMEOUT = 10
+# what radare2 shows for memory we can't read
+UNREADABLE_BYTE = b'\xff'
+
+
+def _recv_exact(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('rap client disconnected')
+        data += chunk
+    return bytes(data)
+
+
+class R2PageCache:
+    def __init__(self, budget=64 * 1024 * 1024):
+        self.max_pages = budget // PAGE_SIZE
+
+        self._lock = threading.Lock()
+        # page address -> bytes, None for pages the agent could not read. lru order
+        self._pages = OrderedDict()
+        # pages the target can change while it runs (writable, heap, stack) or map later (unreadable)
+        self._volatile = set()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def lookup(self, page):
+        with self._lock:
+            if page not in self._pages:
+                return False, None
+            self._pages.move_to_end(page)
+            return True, self._pages[page]
+
+    def put(self, page, data, volatile=False):
+        with self._lock:
+            self._pages[page] = data
+            self._pages.move_to_end(page)
+            if volatile or data is None:
+                self._volatile.add(page)
+            else:
+                self._volatile.discard(page)
+            while len(self._pages) > self.max_pages:
+                self._volatile.discard(self._pages.popitem(last=False)[0])
+
+    def put_range(self, base, data, volatile=True):
+        # fresh memory read for the ui, only whole pages are kept. the protection is not known here
+        start = (base + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+        for page in range(start, base + len(data) - PAGE_SIZE + 1, PAGE_SIZE):
+            self.put(page, bytes(data[page - base:page - base + PAGE_SIZE]), volatile=volatile)
+
+    def drop_volatile(self):
+        # the target ran, what it may have written is read again when r2 touches it
+        with self._lock:
+            for page in self._volatile:
+                self._pages.pop(page, None)
+            dropped = len(self._volatile)
+            self._volatile.clear()
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._volatile.clear()
+
+
+# radare2 opens the whole target address space as rap://127.0.0.1:port//mem, pages are read from the agent when touched
+class R2RapServer(threading.Thread):
+    def __init__(self, plugin, size, host='127.0.0.1'):
+        super(R2RapServer, self).__init__(daemon=True)
+        self._plugin = plugin
+        self.size = size
+        self.cache = R2PageCache()
+
+        self._closed = False
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind((host, 0))
+        self._socket.listen(4)
+        self.host = host
+        self.port = self._socket.getsockname()[1]
+
+        self._ranges_lock = threading.Lock()
+        # target ranges already asked to the agent, sorted by base
+        self._ranges = []
+
+    @property
+    def uri(self):
+        return 'rap://%s:%d//mem' % (self.host, self.port)
+
+    def close(self):
+        self._closed = True
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+    def run(self):
+        while not self._closed:
+            try:
+                connection, address = self._socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        state = {'offset': 0, 'next': None, 'window': 0}
+        try:
+            while not self._closed:
+                op = _recv_exact(connection, 1)[0]
+                if op == RAP_OPEN:
+                    flags, length = struct.unpack('>BB', _recv_exact(connection, 2))
+                    _recv_exact(connection, length)
+                    connection.sendall(struct.pack('>BI', RAP_OPEN | RAP_REPLY, 3))
+                elif op == RAP_READ:
+                    length = struct.unpack('>I', _recv_exact(connection, 4))[0]
+                    data = self.read(state, state['offset'], length)
+                    state['offset'] += length
+                    connection.sendall(struct.pack('>BI', RAP_READ | RAP_REPLY, len(data)) + data)
+                elif op == RAP_WRITE:
+                    # target memory is never written from r2, patches stay in dwarf
+                    length = struct.unpack('>I', _recv_exact(connection, 4))[0]
+                    _recv_exact(connection, length)
+                    connection.sendall(struct.pack('>BI', RAP_WRITE | RAP_REPLY, 0))
+                elif op == RAP_SEEK:
+                    whence, offset = struct.unpack('>BQ', _recv_exact(connection, 9))
+                    if whence == 1:
+                        offset += state['offset']
+                    elif whence == 2:
+                        offset += self.size
+                    state['offset'] = offset & 0xffffffffffffffff
+                    connection.sendall(struct.pack('>BQ', RAP_SEEK | RAP_REPLY, state['offset']))
+                elif op == RAP_CLOSE:
+                    _recv_exact(connection, 4)
+                    connection.sendall(struct.pack('>BI', RAP_CLOSE | RAP_REPLY, 0))
+                elif op in (RAP_SYSTEM, RAP_CMD):
+                    length = struct.unpack('>I', _recv_exact(connection, 4))[0]
+                    _recv_exact(connection, length)
+                    connection.sendall(struct.pack('>BI', op | RAP_REPLY, 0))
+                else:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def read(self, state, offset, length):
+        first = offset & ~(PAGE_SIZE - 1)
+        last = (offset + length + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+        pages = list(range(first, last, PAGE_SIZE))
+
+        if offset == state['next']:
+            state['window'] = min(max(state['window'] * 2, MIN_READ_AHEAD), MAX_READ_AHEAD)
+        else:
+            state['window'] = 0
+        state['next'] = offset + length
+        ahead = list(range(last, min(last + state['window'] * PAGE_SIZE, self.size), PAGE_SIZE))
+
+        missing = [page for page in pages + ahead if not self.cache.lookup(page)[0]]
+        for i in range(0, len(missing), MAX_BATCH_PAGES):
+            self._fetch(missing[i:i + MAX_BATCH_PAGES])
+
+        output = bytearray()
+        for page in pages:
+            found, data = self.cache.lookup(page)
+            output += data if data is not None else UNREADABLE_BYTE * PAGE_SIZE
+        return bytes(output[offset - first:offset - first + length])
+
+    def _fetch(self, pages):
+        try:
+            result, data = self._plugin.agent_bridge.request(
+                'readPages', {'pages': [hex(page) for page in pages], 'pageSize': PAGE_SIZE},
+                timeout=PAGE_READ_TIMEOUT, with_data=True)
+        except Exception as e:
+            # not cached, the next read will try again
+            print('r2 rap read failed at %s: %s' % (hex(pages[0]), str(e)))
+            return
+
+        # '1' read only, 'w' writable, '0' unreadable
+        pos = 0
+        for page, flag in zip(pages, result or ''):
+            if flag in ('1', 'w') and data is not None:
+                self.cache.put(page, bytes(data[pos:pos + PAGE_SIZE]), volatile=flag == 'w')
+                pos += PAGE_SIZE
+            else:
+                self.cache.put(page, None)
+
+    def get_range(self, ptr):
+        with self._ranges_lock:
+            for base, size in self._ranges:
+                if base <= ptr < base + size:
+                    return base, size
+        try:
+            _range = self._plugin.agent_bridge.request('range', {'address': hex(ptr)})
+        except Exception:
+            return None
+        if _range is None:
+            return None
+        base = int(_range['base'], 16)
+        with self._ranges_lock:
+            self._ranges.append((base, _range['size']))
+            self._ranges.sort()
+        return base, _range['size']
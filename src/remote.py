@@ -0,0 +1,140 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import gzip
+import http.client
+import queue
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlparse
+
+# longer commands are posted, the r2 http server drops long request lines
+MAX_URL_LENGTH = 4096
+
+
+class R2RemoteError(Exception):
+    pass
+
+
+# talks to a radare2 http server (r2 -e http.upload=true -c '=h 9090') over a pool of connections.
+# the r2 server answers one request per connection and closes it, so connections are only kept
+# when the server allows keep-alive, and many commands at once are sent in parallel, not pipelined
+class R2HttpTransport:
+    def __init__(self, url, pool_size=4, timeout=60):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', ''):
+            raise R2RemoteError('unsupported r2 remote %s' % url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 9090
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._pool = queue.Queue()
+        for i in range(pool_size):
+            self._pool.put(None)
+        self._executor = None
+        self._upload_root = None
+
+    def _connect(self, timeout):
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _request(self, method, path, body=None, headers=None, timeout=None):
+        connection = self._pool.get()
+        try:
+            # a keep-alive connection may have been dropped by the server, retry once on a new one
+            for attempt in range(2):
+                if connection is None:
+                    connection = self._connect(timeout or self.timeout)
+                elif timeout is not None:
+                    connection.timeout = timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(timeout)
+                try:
+                    connection.request(method, path, body=body, headers=headers or {})
+                    response = connection.getresponse()
+                    data = response.read()
+                    if response.status != 200:
+                        raise R2RemoteError('r2 remote replied %d to %s' % (response.status, path))
+                    if response.getheader('Connection', '').lower() == 'close':
+                        connection.close()
+                        connection = None
+                    return data
+                except (http.client.HTTPException, ConnectionError) as e:
+                    connection.close()
+                    connection = None
+                    if attempt:
+                        raise R2RemoteError(str(e))
+        except Exception:
+            if connection is not None:
+                connection.close()
+                connection = None
+            raise
+        finally:
+            self._pool.put(connection)
+
+    def open(self):
+        # fail early if the server is not there
+        self.cmd('?V')
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+        return self
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        while not self._pool.empty():
+            connection = self._pool.get()
+            if connection is not None:
+                connection.close()
+
+    def is_alive(self):
+        try:
+            self.cmd('?V', timeout=5)
+            return True
+        except Exception:
+            return False
+
+    def cmd(self, cmd, timeout=None):
+        path = '/cmd/' + quote(cmd, safe='')
+        if len(path) > MAX_URL_LENGTH:
+            # scripts and long batches go in the body
+            return self._request('POST', '/cmd/', body=cmd.encode('utf8'), timeout=timeout)
+        return self._request('GET', path, timeout=timeout)
+
+    def cmd_parallel(self, cmds, timeout=None):
+        # independent commands, one request per connection of the pool at a time. results in order
+        if self._executor is None:
+            return [self.cmd(cmd, timeout=timeout) for cmd in cmds]
+        return list(self._executor.map(lambda cmd: self.cmd(cmd, timeout=timeout), cmds))
+
+    def upload(self, name, data):
+        # gzip on the wire and on the remote disk, r2 opens it through the gzip io plugin
+        if self._upload_root is None:
+            self._upload_root = self.cmd('e http.uproot').decode('utf8', errors='ignore').strip()
+
+        name = '%s.gz' % name
+        boundary = uuid.uuid4().hex
+        body = b''.join([
+            ('--%s\r\n' % boundary).encode('utf8'),
+            ('Content-Disposition: form-data; name="file"; filename="%s"\r\n' % name).encode('utf8'),
+            b'Content-Type: application/octet-stream\r\n\r\n',
+            gzip.compress(bytes(data), compresslevel=1),
+            ('\r\n--%s--\r\n' % boundary).encode('utf8')
+        ])
+        self._request('POST', '/up/' + quote(name), body=body,
+                      headers={'Content-Type': 'multipart/form-data; boundary=%s' % boundary})
+        return 'gzip://%s/%s' % (self._upload_root.rstrip('/'), name)
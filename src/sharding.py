@@ -0,0 +1,188 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from r2dwarf.src.analysis import ANALYSIS_TIMEOUT
+from r2dwarf.src.bulk import R2WorkerPool
+from r2dwarf.src.module import map_module
+
+SHARD_ALIGN = 0x1000
+
+XREF_COMMANDS = {
+    'CALL': 'axC',
+    'CODE': 'axc',
+    'DATA': 'axd',
+    'STRING': 'axs'
+}
+
+
+def shard_ranges(start, end, count):
+    size = end - start
+    shard_size = max(SHARD_ALIGN, (size // count + SHARD_ALIGN - 1) & ~(SHARD_ALIGN - 1))
+    shards = []
+    shard_start = start
+    while shard_start < end:
+        shards.append((shard_start, min(end, shard_start + shard_size)))
+        shard_start += shard_size
+    return shards
+
+
+def _loads(data, default):
+    try:
+        return json.loads(data) if data else default
+    except ValueError:
+        return default
+
+
+def analyze_shard(process, start, end):
+    # aac finds the call targets, on a raw map aa alone has almost no entry points
+    process.cmd('e anal.from = %d; e anal.to = %d; e anal.in = raw; aa; aac; aar' % (start, end))
+
+    functions = []
+    for function in _loads(process.cmd('aflj'), []):
+        if not start <= function['offset'] < end:
+            continue
+        function['blocks'] = _loads(process.cmd('afbj @ %s' % hex(function['offset'])), [])
+        functions.append(function)
+
+    xrefs = [x for x in _loads(process.cmd('axj'), []) if start <= x.get('from', -1) < end]
+    return functions, xrefs
+
+
+def merge_shards(results):
+    # results are ordered by shard, each one only holds functions starting inside its own shard
+    functions = []
+    xrefs = []
+    for shard_functions, shard_xrefs in results:
+        functions.extend(shard_functions)
+        xrefs.extend(shard_xrefs)
+    functions.sort(key=lambda f: f['offset'])
+
+    call_targets = set(x['to'] for x in xrefs if x.get('type') == 'CALL')
+
+    # a shard starting in the middle of a function sees its tail as a new function
+    # drop those when the blocks of an earlier function already cover them and nothing calls them
+    merged = []
+    covered = []
+    for function in functions:
+        offset = function['offset']
+        if offset not in call_targets and any(s <= offset < e for s, e in covered):
+            continue
+        merged.append(function)
+        for block in function['blocks']:
+            covered.append((block['addr'], block['addr'] + block['size']))
+        # only the last few functions can cover the next ones
+        covered = covered[-256:]
+    return merged, xrefs
+
+
+def merge_script(functions, xrefs):
+    script = []
+    for function in functions:
+        offset = hex(function['offset'])
+        script.append('af+ %s %s' % (offset, function['name']))
+        for block in function['blocks']:
+            line = 'afb+ %s %s %d' % (offset, hex(block['addr']), block['size'])
+            if 'jump' in block:
+                line += ' %s' % hex(block['jump'])
+                if 'fail' in block:
+                    line += ' %s' % hex(block['fail'])
+            script.append(line)
+    for xref in xrefs:
+        cmd = XREF_COMMANDS.get(xref.get('type'))
+        if cmd is not None:
+            script.append('%s %s %s' % (cmd, hex(xref['to']), hex(xref['from'])))
+    return script
+
+
+class R2ShardedAnalysis(QThread):
+    onR2ShardedAnalysisProgress = pyqtSignal(list, name='onR2ShardedAnalysisProgress')
+    onR2ShardedAnalysisFinished = pyqtSignal(list, name='onR2ShardedAnalysisFinished')
+
+    def __init__(self, plugin, address, workers=None):
+        super(R2ShardedAnalysis, self).__init__()
+        self._plugin = plugin
+        self._pipe = plugin.pipe
+        self._address = address
+        self._workers = workers
+
+    def run(self):
+        start_time = time.time()
+        try:
+            module = map_module(self._plugin, self._address, analyze=False)
+        except Exception as e:
+            self.onR2ShardedAnalysisFinished.emit([None, 0, 0, str(e)])
+            return
+        if module is None:
+            self.onR2ShardedAnalysisFinished.emit([None, 0, 0, 'no module at %s' % self._address])
+            return
+
+        try:
+            count = self._analyze(module)
+        except Exception as e:
+            self.onR2ShardedAnalysisFinished.emit([None, 0, 0, str(e)])
+            return
+        self.onR2ShardedAnalysisFinished.emit([module, count, time.time() - start_time, None])
+
+    def _analyze(self, module):
+        base = int(module['base'], 16)
+        end = base + module['size']
+        maps = self._pipe.get_maps_in(base, end)
+
+        pool = R2WorkerPool(self._pipe.get_worker_config(), maps, self._workers,
+                            script=self._plugin.symbol_sync.module_script(base, end))
+        try:
+            results = self._run_shards(pool, shard_ranges(base, end, pool.size))
+        finally:
+            pool.close()
+
+        functions, xrefs = merge_shards([r for r in results if r is not None])
+
+        self._pipe.run_script(merge_script(functions, xrefs), name='shards', timeout=ANALYSIS_TIMEOUT,
+                              journal_range=(base, end))
+
+        for map_base, size, path in maps:
+            self._pipe.set_analyzed(map_base)
+            self._plugin.function_index.refresh_range(self._pipe, map_base, map_base + size)
+        return len(functions)
+
+    def _run_shards(self, pool, shards):
+        results = [None] * len(shards)
+
+        def _run_shard(index):
+            process = pool.spawn()
+            try:
+                return index, analyze_shard(process, *shards[index])
+            finally:
+                process.close()
+
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            done = 0
+            for future in as_completed([executor.submit(_run_shard, i) for i in range(len(shards))]):
+                try:
+                    index, result = future.result()
+                    results[index] = result
+                except Exception as e:
+                    print('r2 shard analysis: %s' % str(e))
+                done += 1
+                self.onR2ShardedAnalysisProgress.emit([done, len(shards)])
+        return results
@@ -0,0 +1,153 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import functools
+import os
+import sys
+import threading
+import time
+
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from r2dwarf.src.cache import R2DWARF_HOME
+
+# seconds the ui thread can be busy in a single call before it counts as a stall
+STALL_THRESHOLD = .05
+# seconds between two stack samples of the ui thread while it is in a timed call
+SAMPLE_INTERVAL = .005
+MAX_STALLS = 200
+
+
+def _fold_frame(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def ui_slot(fn):
+    # time a slot connected to a signal (thread results, pipe replies, widget events) of the plugin or of
+    # a widget holding the plugin. menu actions and setup hooks only start work and are left out
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        stall_detector = getattr(getattr(self, 'plugin', self), 'stall_detector', None)
+        if stall_detector is None:
+            return fn(self, *args, **kwargs)
+        with stall_detector.timed(fn.__name__):
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+# must be created on the ui thread
+class R2StallDetector:
+    def __init__(self, threshold=STALL_THRESHOLD, sample_interval=SAMPLE_INTERVAL):
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.ui_thread_id = threading.get_ident()
+
+        self.jank = 0
+        self.worst = 0
+        self.stalls = deque(maxlen=MAX_STALLS)
+
+        self._lock = threading.Lock()
+        # names of the timed calls running on the ui thread, outermost first
+        self._active = []
+        self._samples = []
+        # folded stacks of all the stalls, what flamegraph.pl and speedscope read
+        self._folded = Counter()
+        self._listeners = []
+
+        self._sampling = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @contextmanager
+    def timed(self, name):
+        if threading.get_ident() != self.ui_thread_id:
+            yield
+            return
+
+        outermost = not self._active
+        self._active.append(name)
+        if outermost:
+            with self._lock:
+                self._samples = []
+            self._sampling.set()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start_time
+            self._active.pop()
+            if outermost:
+                self._sampling.clear()
+                if duration >= self.threshold:
+                    self._record(name, duration)
+
+    def _record(self, name, duration):
+        with self._lock:
+            samples = Counter(self._samples)
+            self._samples = []
+            self.jank += 1
+            self.worst = max(self.worst, duration)
+            self.stalls.append({'name': name, 'time': time.time(), 'duration': duration, 'samples': samples})
+            for stack, count in samples.items():
+                self._folded[stack] += count
+
+        for listener in list(self._listeners):
+            try:
+                listener(name, duration)
+            except Exception as e:
+                print('r2 stall listener failed: %s' % str(e))
+
+    def _sample_loop(self):
+        while True:
+            self._sampling.wait()
+            time.sleep(self.sample_interval)
+            active = list(self._active)
+            frame = sys._current_frames().get(self.ui_thread_id)
+            if not active or frame is None or not self._sampling.is_set():
+                continue
+            stack = '%s;%s' % (';'.join(active), _fold_frame(frame))
+            with self._lock:
+                self._samples.append(stack)
+
+    def reset(self):
+        with self._lock:
+            self.jank = 0
+            self.worst = 0
+            self.stalls.clear()
+            self._folded.clear()
+
+    def export_folded(self, path=None):
+        if path is None:
+            path = os.path.join(R2DWARF_HOME, 'stalls', 'stalls_%d.folded' % time.time())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            lines = ['%s %d' % (stack, count) for stack, count in self._folded.most_common()]
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
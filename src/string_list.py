@@ -0,0 +1,73 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
+from PyQt5.QtWidgets import QLineEdit, QVBoxLayout, QWidget
+
+from dwarf_debugger.lib import utils
+from dwarf_debugger.ui.panels.panel_debug import DEBUG_VIEW_DISASSEMBLY, DEBUG_VIEW_MEMORY
+from dwarf_debugger.ui.widgets.list_view import DwarfListView
+from r2dwarf.src.stalls import ui_slot
+
+
+# search as you type in the string indexes of the mapped modules
+class R2StringList(QWidget):
+    def __init__(self, plugin):
+        super().__init__()
+
+        self.plugin = plugin
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText('strings')
+        self.search_input.textChanged.connect(self.on_search)
+
+        self.strings_model = QStandardItemModel(0, 4)
+        self.strings_model.setHeaderData(0, Qt.Horizontal, 'address')
+        self.strings_model.setHeaderData(1, Qt.Horizontal, 'string')
+        self.strings_model.setHeaderData(2, Qt.Horizontal, 'xrefs')
+        self.strings_model.setHeaderData(3, Qt.Horizontal, 'module')
+
+        self.strings_list = DwarfListView()
+        self.strings_list.setModel(self.strings_model)
+        self.strings_list.doubleClicked.connect(self._item_double_clicked)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.search_input)
+        layout.addWidget(self.strings_list)
+
+    @ui_slot
+    def on_search(self, text):
+        self.strings_model.setRowCount(0)
+        for result in self.plugin.string_store.search(text.strip()):
+            self.strings_model.appendRow([
+                QStandardItem(hex(result['address'])),
+                QStandardItem(result['string']),
+                QStandardItem(' '.join(hex(ref) for ref in result['xrefs'])),
+                QStandardItem(result['module'])
+            ])
+
+    @ui_slot
+    def _item_double_clicked(self, model_index):
+        row = model_index.row()
+        xrefs = self.strings_model.item(row, 2).text().split()
+        if model_index.column() == 2 and xrefs:
+            # the code using the string
+            self.plugin.debug_panel.jump_to_address(utils.parse_ptr(xrefs[0]), DEBUG_VIEW_DISASSEMBLY)
+        else:
+            self.plugin.debug_panel.jump_to_address(
+                utils.parse_ptr(self.strings_model.item(row, 0).text()), DEBUG_VIEW_MEMORY)
@@ -0,0 +1,325 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+from array import array
+from bisect import bisect_right
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from r2dwarf.src.cache import R2DWARF_HOME
+
+# bump when the scan or the file layout changes, older indexes are rebuilt
+STRING_INDEX_VERSION = 2
+MIN_STRING_LENGTH = 4
+MAX_RESULTS = 200
+
+ENCODINGS = ['ascii', 'utf16le']
+_ASCII_RE = re.compile(rb'[\x20-\x7e\t]{%d,}' % MIN_STRING_LENGTH)
+_UTF16_RE = re.compile(rb'(?:[\x20-\x7e\t]\x00){%d,}' % MIN_STRING_LENGTH)
+
+
+def _printable(byte):
+    return 0x20 <= byte <= 0x7e or byte == 0x09
+
+
+def scan_strings(data, base):
+    strings = []
+    for match in _ASCII_RE.finditer(data):
+        strings.append((base + match.start(), 0, match.group().decode('ascii')))
+    for match in _UTF16_RE.finditer(data):
+        start, end = match.span()
+        if start > 0 and _printable(data[start - 1]):
+            # the first unit is the last char of an ascii string and its nul, the wide string starts after
+            start += 2
+        if (end - start) // 2 >= MIN_STRING_LENGTH:
+            strings.append((base + start, 1, data[start:end].decode('utf-16-le')))
+    strings.sort()
+    return strings
+
+
+def _trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+# strings of a module with the xrefs to them, in flat arrays
+class R2StringIndex:
+    def __init__(self, name, key, base=0, path=None):
+        self.name = name
+        self.key = key
+        # module base the addresses are relative to and module file
+        self.base = base
+        self.path = path or name
+
+        self.addresses = array('Q')
+        self.encodings = array('B')
+        # text of string i is text[offsets[i]:offsets[i + 1]]
+        self.offsets = array('I', [0])
+        self.text = ''
+        # xrefs to string i are xref_froms[xref_offsets[i]:xref_offsets[i + 1]]
+        self.xref_offsets = array('I', [0])
+        self.xref_froms = array('Q')
+
+        self._lower = ''
+        self._trigrams = {}
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def build(self, strings, xrefs):
+        # xrefs is a dict of string address -> list of addresses referencing it
+        texts = []
+        length = 0
+        for address, encoding, text in strings:
+            self.addresses.append(address)
+            self.encodings.append(encoding)
+            texts.append(text)
+            length += len(text)
+            self.offsets.append(length)
+            froms = xrefs.get(address, ())
+            self.xref_froms.extend(froms)
+            self.xref_offsets.append(len(self.xref_froms))
+        self.text = ''.join(texts)
+        self._build_search()
+
+    def _build_search(self):
+        self._lower = self.text.lower()
+        trigrams = {}
+        for i in range(len(self.addresses)):
+            for trigram in _trigrams(self._lower[self.offsets[i]:self.offsets[i + 1]]):
+                postings = trigrams.get(trigram)
+                if postings is None:
+                    postings = trigrams[trigram] = array('I')
+                postings.append(i)
+        self._trigrams = trigrams
+
+    def rebase(self, base):
+        # the same module loaded somewhere else
+        delta = base - self.base
+        if delta:
+            mask = 0xffffffffffffffff
+            self.addresses = array('Q', ((a + delta) & mask for a in self.addresses))
+            self.xref_froms = array('Q', ((a + delta) & mask for a in self.xref_froms))
+            self.base = base
+
+    def get(self, i):
+        return {
+            'address': self.addresses[i],
+            'encoding': ENCODINGS[self.encodings[i]],
+            'string': self.text[self.offsets[i]:self.offsets[i + 1]],
+            'xrefs': list(self.xref_froms[self.xref_offsets[i]:self.xref_offsets[i + 1]]),
+            'module': self.name
+        }
+
+    def search(self, query, limit=MAX_RESULTS):
+        query = query.lower()
+        if not query:
+            return []
+
+        if len(query) < 3:
+            # too short for the trigrams, find runs in C over the whole text
+            found = []
+            pos = self._lower.find(query)
+            while pos >= 0 and len(found) < limit:
+                i = bisect_right(self.offsets, pos) - 1
+                if pos + len(query) <= self.offsets[i + 1]:
+                    found.append(i)
+                    pos = self.offsets[i + 1]
+                else:
+                    pos += 1
+                pos = self._lower.find(query, pos)
+            return found
+
+        postings = sorted((self._trigrams.get(t, ()) for t in _trigrams(query)), key=len)
+        if not postings or not postings[0]:
+            return []
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                return []
+
+        found = []
+        for i in sorted(candidates):
+            if query in self._lower[self.offsets[i]:self.offsets[i + 1]]:
+                found.append(i)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def save(self, path):
+        header = json.dumps({
+            'version': STRING_INDEX_VERSION,
+            'name': self.name,
+            'key': self.key,
+            'base': self.base,
+            'path': self.path,
+            'count': len(self.addresses),
+            'xrefs': len(self.xref_froms)
+        }).encode('utf8')
+        text = self.text.encode('utf8')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(struct.pack('<II', len(header), len(text)))
+            f.write(header)
+            for data in (self.addresses, self.encodings, self.offsets, self.xref_offsets, self.xref_froms):
+                f.write(data.tobytes())
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            header_size, text_size = struct.unpack('<II', f.read(8))
+            header = json.loads(f.read(header_size).decode('utf8'))
+            if header.get('version') != STRING_INDEX_VERSION:
+                return None
+
+            index = R2StringIndex(header['name'], header['key'], header['base'], header['path'])
+            index.addresses = array('Q')
+            index.encodings = array('B')
+            index.offsets = array('I')
+            index.xref_offsets = array('I')
+            index.xref_froms = array('Q')
+            for data, count in ((index.addresses, header['count']), (index.encodings, header['count']),
+                                (index.offsets, header['count'] + 1), (index.xref_offsets, header['count'] + 1),
+                                (index.xref_froms, header['xrefs'])):
+                data.frombytes(f.read(count * data.itemsize))
+            index.text = f.read(text_size).decode('utf8')
+        index._build_search()
+        return index
+
+
+class R2StringStore:
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(R2DWARF_HOME, 'strings')
+        self.path = path
+        self._lock = threading.Lock()
+        # module base -> index
+        self._indexes = {}
+
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError:
+            # memory only
+            self.path = None
+
+    def _file(self, name, path):
+        # modules with the same name from different paths (i.e per app copies) get their own index
+        path_hash = hashlib.sha1(path.encode('utf8')).hexdigest()[:12]
+        return os.path.join(self.path, '%s_%s.idx' % (re.sub(r'[^\w.]', '_', name), path_hash))
+
+    def add(self, base, index):
+        with self._lock:
+            self._indexes[base] = index
+        if self.path is not None:
+            try:
+                index.save(self._file(index.name, index.path))
+            except OSError as e:
+                print('r2 string index not saved: %s' % str(e))
+
+    def load(self, base, name, path, key):
+        if self.path is None:
+            return None
+        try:
+            index = R2StringIndex.load(self._file(name, path))
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        if index is None or index.key != key:
+            return None
+        index.rebase(base)
+        with self._lock:
+            self._indexes[base] = index
+        return index
+
+    def search(self, query, limit=MAX_RESULTS):
+        with self._lock:
+            indexes = list(self._indexes.values())
+        results = []
+        for index in indexes:
+            results.extend(index.get(i) for i in index.search(query, limit - len(results)))
+            if len(results) >= limit:
+                break
+        return results
+
+
+def index_module(plugin, module):
+    pipe = plugin.pipe
+    base = int(module['base'], 16)
+    end = base + module['size']
+
+    module_path = module.get('path') or module['name']
+
+    # the module bytes are in the map files already, no need to go through r2 or the agent.
+    # the key only covers the read only sections, relative to the base, so it holds across runs and aslr
+    ranges = []
+    key = hashlib.sha1(('%d:%s' % (STRING_INDEX_VERSION, module['name'])).encode('utf8'))
+    for entry in pipe.maps.entries_in(base, end):
+        with open(entry.path, 'rb') as f:
+            data = f.read()
+        if 'w' not in entry.perm:
+            key.update(struct.pack('<Q', entry.base - base))
+            key.update(data)
+        ranges.append((entry.base, data))
+    key = key.hexdigest()
+
+    index = plugin.string_store.load(base, module['name'], module_path, key)
+    if index is not None:
+        return index, True
+
+    strings = []
+    for range_base, data in ranges:
+        strings.extend(scan_strings(data, range_base))
+
+    addresses = set(s[0] for s in strings)
+    xrefs = {}
+    try:
+        refs = json.loads(pipe.cmdj('axj') or '[]')
+    except ValueError:
+        refs = []
+    for ref in refs:
+        if ref.get('to') in addresses:
+            xrefs.setdefault(ref['to'], []).append(ref['from'])
+
+    index = R2StringIndex(module['name'], key, base, module_path)
+    index.build(strings, xrefs)
+    plugin.string_store.add(base, index)
+    return index, False
+
+
+class R2StringIndexer(QThread):
+    onR2StringIndexerFinished = pyqtSignal(list, name='onR2StringIndexerFinished')
+
+    def __init__(self, plugin, module):
+        super(R2StringIndexer, self).__init__()
+        self._plugin = plugin
+        self._module = module
+
+    def run(self):
+        start_time = time.time()
+        try:
+            index, loaded = index_module(self._plugin, self._module)
+        except Exception as e:
+            self.onR2StringIndexerFinished.emit([self._module['name'], 0, 0, False, str(e)])
+            return
+        self.onR2StringIndexerFinished.emit([self._module['name'], len(index), time.time() - start_time, loaded, None])
@@ -0,0 +1,149 @@
+"""
+Dwarf - Copyright (C) 2019 Giovanni Rocca (iGio90)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>
+"""
+import re
+import threading
+
+
+def flag_name(prefix, name):
+    return prefix + re.sub(r'[^\w.]', '_', name)
+
+
+class R2SymbolSync:
+    def __init__(self, plugin):
+        self._plugin = plugin
+        self._lock = threading.Lock()
+
+        # module base -> flags and function hints of the module
+        self._modules = {}
+        self._flagged = set()
+        # keep track of ranges without a module so we don't ask the agent again
+        self._no_module = set()
+
+    def reset(self):
+        # a new pipe lost all the flags
+        with self._lock:
+            self._flagged.clear()
+
+    def _get_module(self, address):
+        with self._lock:
+            for base in self._modules:
+                module = self._modules[base]
+                if base <= address < base + module['size']:
+                    return module
+            if address in self._no_module:
+                return None
+
+        symbols = self._plugin.agent_bridge.request('moduleSymbols', {'address': hex(address)})
+        if symbols is None:
+            with self._lock:
+                self._no_module.add(address)
+            return None
+
+        module = {'name': symbols['name'], 'base': int(symbols['base'], 16), 'size': symbols['size'],
+                  'flags': [], 'functions': []}
+        # arm32 thumb functions have the low bit set, r2 wants the real address and a 16 bits hint
+        thumb_capable = symbols.get('arch') == 'arm'
+
+        def _function(name, address):
+            thumb = thumb_capable and address & 1 == 1
+            if thumb:
+                address &= ~1
+            module['functions'].append((name, address, thumb))
+            return address
+
+        for name, export_address, export_type in symbols['exports']:
+            export_address = int(export_address, 16)
+            if export_type == 'function':
+                export_address = _function(flag_name('sym.', name), export_address)
+            module['flags'].append((flag_name('sym.', name), 1, export_address))
+        for name, slot, import_type in symbols['imports']:
+            if slot is not None:
+                module['flags'].append((flag_name('reloc.', name), symbols['pointerSize'], int(slot, 16)))
+        exported = set(f[1] for f in module['functions'])
+        for name, symbol_address, symbol_type, size in symbols['symbols']:
+            symbol_address = int(symbol_address, 16)
+            if symbol_type == 'function':
+                if (symbol_address & ~1 if thumb_capable else symbol_address) not in exported:
+                    symbol_address = _function(flag_name('sym.', name), symbol_address)
+                    module['flags'].append((flag_name('sym.', name), size or 1, symbol_address))
+            elif symbol_type == 'object':
+                module['flags'].append((flag_name('obj.', name), size or 1, symbol_address))
+
+        with self._lock:
+            self._modules[module['base']] = module
+        return module
+
+    def _flag_lines(self, module):
+        lines = ['fs symbols']
+        for name, size, address in module['flags']:
+            lines.append('f %s %d @ %s' % (name, size, hex(address)))
+        lines.append('fs *')
+        return lines
+
+    def _hint_lines(self, module, start, end):
+        lines = []
+        for name, address, thumb in module['functions']:
+            if start <= address < end:
+                if thumb:
+                    lines.append('ahb 16 @ %s' % hex(address))
+                lines.append('af %s @ %s' % (name, hex(address)))
+        return lines
+
+    def module_script(self, start, end):
+        # flags and hints of the module in a single script, for the worker processes
+        try:
+            module = self._get_module(start)
+        except Exception as e:
+            print('r2 symbol sync failed at %s: %s' % (hex(start), str(e)))
+            return []
+        if module is None:
+            return []
+        return self._flag_lines(module) + self._hint_lines(module, start, end)
+
+    def seed(self, start, end):
+        try:
+            return self._seed(start, end)
+        except Exception as e:
+            # pipe or agent errors, the analysis goes on without the symbols
+            print('r2 symbol sync failed at %s: %s' % (hex(start), str(e)))
+            return False
+
+    def _seed(self, start, end):
+        pipe = self._plugin.pipe
+        module = self._get_module(start)
+        if module is None:
+            return False
+
+        flags = []
+        with self._lock:
+            if module['base'] not in self._flagged:
+                flags = self._flag_lines(module)
+        if flags:
+            # one journal entry per module and per seeded range, seeding again doesn't grow the journal
+            pipe.run_script(flags, name='symbols', journal_key='symbols:%s' % hex(module['base']))
+            # only once r2 has them, a failed script is tried again on the next seed
+            with self._lock:
+                self._flagged.add(module['base'])
+
+        # function hints, only where we have bytes mapped
+        script = self._hint_lines(module, start, end)
+        if not script:
+            return bool(flags)
+
+        pipe.run_script(script, name='symbols', journal_key='symbols:%s:%s' % (hex(start), hex(end)),
+                        journal_range=(start, end))
+        return True
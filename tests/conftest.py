@@ -0,0 +1,11 @@
+import os
+import sys
+import types
+
+# the plugin is imported as r2dwarf by dwarf, make the checkout importable under that name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'r2dwarf' not in sys.modules:
+    package = types.ModuleType('r2dwarf')
+    package.__path__ = [ROOT]
+    sys.modules['r2dwarf'] = package
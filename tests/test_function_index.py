@@ -0,0 +1,103 @@
+import json
+
+from r2dwarf.src.function_index import R2FunctionIndex, load_functions_in
+
+
+def _function(offset, size, name=None):
+    return {'offset': offset, 'size': size, 'name': name or 'fcn.%08x' % offset}
+
+
+class _Pipe:
+    def __init__(self, functions, blocks):
+        # function offset -> afbj blocks
+        self.functions = functions
+        self.blocks = blocks
+        self.commands = []
+
+    def cmdj(self, cmd):
+        self.commands.append(cmd)
+        if cmd == 'aflj':
+            return json.dumps(self.functions)
+        if cmd == 'aflqj':
+            return json.dumps([f['offset'] for f in self.functions])
+        offsets = [int(o, 16) for o in cmd.split('@@= ')[1].split()]
+        if cmd.startswith('afij'):
+            return '\n'.join(json.dumps([f for f in self.functions if f['offset'] == o]) for o in offsets)
+        return '\n'.join(json.dumps(self.blocks.get(o, [])) for o in offsets)
+
+
+def test_find_by_bounds():
+    index = R2FunctionIndex()
+    index.rebuild([_function(0x3000, 0x10), _function(0x1000, 0x100), _function(0x2000, 0x20)])
+
+    assert index.find(0x1000)['offset'] == 0x1000
+    assert index.find(0x10ff)['offset'] == 0x1000
+    assert index.find(0x1100) is None
+    assert index.find(0xfff) is None
+    assert index.find(0x300f)['offset'] == 0x3000
+    assert [f['offset'] for f in index.all()] == [0x1000, 0x2000, 0x3000]
+
+
+def test_find_nested_function():
+    index = R2FunctionIndex()
+    # a tail at 0x1080 inside the outer function
+    index.rebuild([_function(0x1000, 0x100), _function(0x1080, 0x10)])
+
+    assert index.find(0x1084)['offset'] == 0x1080
+    assert index.find(0x1090)['offset'] == 0x1000
+    assert index.find(0x1010)['offset'] == 0x1000
+
+
+def test_find_checks_basic_blocks():
+    function = _function(0x1000, 0x100)
+    function['blocks'] = [(0x1000, 0x1010), (0x1080, 0x1100)]
+    index = R2FunctionIndex()
+    index.rebuild([function])
+
+    assert index.find(0x1008)['offset'] == 0x1000
+    assert index.find(0x1040) is None
+    assert index.find(0x1040, exact=False)['offset'] == 0x1000
+
+
+def test_update_replaces_function():
+    index = R2FunctionIndex()
+    index.rebuild([_function(0x1000, 0x10)])
+    index.update([_function(0x1000, 0x100, 'main')])
+
+    assert len(index) == 1
+    assert index.find(0x1080)['name'] == 'main'
+
+
+def test_remove_range():
+    index = R2FunctionIndex()
+    index.rebuild([_function(0x1000, 0x10), _function(0x2000, 0x10), _function(0x3000, 0x10)])
+
+    removed = index.remove_range(0x2000, 0x3000)
+    assert [f['offset'] for f in removed] == [0x2000]
+    assert index.find(0x2004) is None
+    assert [f['offset'] for f in index.functions_in(0, 0x10000)] == [0x1000, 0x3000]
+    # removed offsets don't come back on update of the others
+    index.update([_function(0x3000, 0x20)])
+    assert [f['offset'] for f in index.all()] == [0x1000, 0x3000]
+
+
+def test_refresh_range_loads_blocks():
+    pipe = _Pipe([_function(0x1000, 0x100), _function(0x5000, 0x10)],
+                 {0x1000: [{'addr': 0x1000, 'size': 0x10}]})
+    index = R2FunctionIndex()
+    index.rebuild([_function(0x1000, 0x20), _function(0x9000, 0x10)])
+
+    index.refresh_range(pipe, 0x1000, 0x2000)
+
+    assert [f['offset'] for f in index.all()] == [0x1000, 0x9000]
+    assert index.find(0x1008)['size'] == 0x100
+    assert index.find(0x1040) is None
+
+
+def test_load_functions_in_without_blocks():
+    pipe = _Pipe([_function(0x1000, 0x100), _function(0x5000, 0x10)], {})
+
+    functions = load_functions_in(pipe, 0x1000, 0x2000, blocks=False)
+
+    assert [f['offset'] for f in functions] == [0x1000]
+    assert pipe.commands == ['aflj']
@@ -0,0 +1,50 @@
+from r2dwarf.src.journal import R2Journal
+from r2dwarf.src.maps import R2MapManager
+
+
+def test_replay_order():
+    journal = R2Journal()
+    journal.record_cmd('e asm.arch=arm; e anal.from = 4096; e asm.bits = 16')
+    journal.record_script(['f sym.main 4 @ 0x1000'])
+
+    maps = R2MapManager()
+    maps.add(0x1000, 0x1000, '/tmp/r2 dwarf/0x1000', 'r-x', 3)
+
+    script = journal.replay_script(maps=maps.entries_in(0, 1 << 64),
+                                   functions=[{'name': 'main', 'offset': 0x1000}], seek='0x1004')
+
+    assert script == [
+        'e asm.arch=arm',
+        'e asm.bits=16',
+        'on "/tmp/r2 dwarf/0x1000" 0x1000 r-x',
+        'f sym.main 4 @ 0x1000',
+        'af main @ 0x1000',
+        's 0x1004',
+    ]
+
+
+def test_remote_uris_are_not_quoted():
+    maps = R2MapManager()
+    maps.add(0x1000, 0x1000, '/tmp/0x1000', 'r-x', 3, uri='gzip:///tmp/uploads/r2_0x1000')
+
+    assert R2Journal().replay_script(maps=maps.entries_in(0, 1 << 64)) == \
+        ['on gzip:///tmp/uploads/r2_0x1000 0x1000 r-x']
+
+
+def test_keyed_script_replaces_previous():
+    journal = R2Journal()
+    journal.record_script(['f a @ 0x1000'], key='symbols:0x1000')
+    journal.record_script(['f b @ 0x1000'], key='symbols:0x1000')
+
+    assert journal.replay_script() == ['f b @ 0x1000']
+
+
+def test_drop_range():
+    journal = R2Journal()
+    journal.record_script(['af @ 0x1000'], address_range=(0x1000, 0x2000))
+    journal.record_script(['af @ 0x2000'], address_range=(0x2000, 0x3000))
+    journal.record_script(['f global @ 0x1000'])
+
+    assert journal.drop_range(0x1800, 0x2000) == 1
+    assert journal.replay_script() == ['af @ 0x2000', 'f global @ 0x1000']
+    assert journal.drop_range(0x5000, 0x6000) == 0
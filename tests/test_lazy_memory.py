@@ -0,0 +1,101 @@
+import pytest
+
+from r2dwarf.src.maps import R2MapManager
+from r2dwarf.src.rap import PAGE_SIZE, R2PageCache, R2RapServer
+
+
+class _Bridge:
+    def __init__(self, memory, writable=()):
+        # page address -> bytes
+        self.memory = memory
+        self.writable = set(writable)
+        self.requests = []
+
+    def request(self, op, params=None, timeout=None, with_data=False):
+        self.requests.append((op, params))
+        if op == 'readPages':
+            flags = ''
+            data = b''
+            for page in params['pages']:
+                page = int(page, 16)
+                if page in self.memory:
+                    flags += 'w' if page in self.writable else '1'
+                    data += self.memory[page]
+                else:
+                    flags += '0'
+            return flags, data
+        if op == 'module':
+            return {'name': 'libtarget.so', 'base': hex(0x10000), 'size': 2 * PAGE_SIZE}
+        if op == 'moduleRanges':
+            return [{'base': hex(0x10000), 'size': PAGE_SIZE, 'protection': 'r-x'},
+                    {'base': hex(0x11000), 'size': PAGE_SIZE, 'protection': 'rw-'}]
+        if op == 'read':
+            return None, bytes([0x90]) * params['size']
+        return None
+
+
+class _Plugin:
+    def __init__(self, bridge):
+        self.agent_bridge = bridge
+
+
+def test_page_cache_drops_volatile_pages():
+    cache = R2PageCache()
+    cache.put(0x1000, b'a' * PAGE_SIZE)
+    cache.put(0x2000, b'b' * PAGE_SIZE, volatile=True)
+    cache.put(0x3000, None)
+
+    assert cache.drop_volatile() == 2
+    assert cache.lookup(0x1000) == (True, b'a' * PAGE_SIZE)
+    assert cache.lookup(0x2000) == (False, None)
+    assert cache.lookup(0x3000) == (False, None)
+
+
+def test_rap_read_refetches_writable_pages_after_resume():
+    bridge = _Bridge({0x1000: b'c' * PAGE_SIZE, 0x2000: b'd' * PAGE_SIZE}, writable=[0x2000])
+    server = R2RapServer(_Plugin(bridge), 1 << 32)
+    try:
+        state = {'offset': 0, 'next': None, 'window': 0}
+        assert server.read(state, 0x1ffe, 4) == b'ccdd'
+
+        bridge.memory[0x1000] = b'x' * PAGE_SIZE
+        bridge.memory[0x2000] = b'y' * PAGE_SIZE
+        server.cache.drop_volatile()
+        # the read only page is still cached, the writable one comes from the target again
+        assert server.read(state, 0x1ffe, 4) == b'ccyy'
+    finally:
+        server.close()
+
+
+def test_map_module_with_lazy_memory():
+    pytest.importorskip('PyQt5')
+    from r2dwarf.src.module import map_module
+
+    class _Pipe:
+        def __init__(self):
+            self.maps = R2MapManager()
+
+        def is_mapped(self, ptr):
+            # the rap fallback, every address of the target looks mapped
+            return True
+
+        def map_ranges(self, ranges, name=None):
+            for i, (base, data, perm) in enumerate(ranges):
+                self.maps.add(base, len(data), '/tmp/%s.%d' % (name, i), perm, 3 + i)
+
+        def get_maps_in(self, start, end):
+            return [(e.base, e.size, e.path) for e in self.maps.entries_in(start, end)]
+
+    class _SymbolSync:
+        def seed(self, start, end):
+            return False
+
+    plugin = _Plugin(_Bridge({}))
+    plugin.pipe = _Pipe()
+    plugin.symbol_sync = _SymbolSync()
+
+    module = map_module(plugin, hex(0x10000), analyze=False)
+
+    assert module['name'] == 'libtarget.so'
+    assert [(base, size) for base, size, path in plugin.pipe.get_maps_in(0x10000, 0x12000)] == \
+        [(0x10000, PAGE_SIZE), (0x11000, PAGE_SIZE)]
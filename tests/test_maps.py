@@ -0,0 +1,78 @@
+from r2dwarf.src.maps import R2MapManager
+
+
+def _manager(memory_budget, disk_budget):
+    evicted = []
+    maps = R2MapManager(memory_budget=memory_budget, disk_budget=disk_budget,
+                        on_evict=lambda entry, fd, drop_file: evicted.append((entry.base, fd, drop_file)))
+    return maps, evicted
+
+
+def test_lookups_by_base_and_address():
+    maps, evicted = _manager(1 << 20, 1 << 20)
+    maps.add(0x1000, 0x1000, '/tmp/0x1000', 'r-x', 3)
+    maps.add(0x3000, 0x1000, '/tmp/0x3000', 'rw-', 4)
+
+    assert maps.get(0x1000).fd == 3
+    assert maps.get(0x1800) is None
+    assert maps.contains(0x1800).base == 0x1000
+    assert maps.contains(0x2800) is None
+    assert [e.base for e in maps.entries_in(0x1800, 0x3001)] == [0x1000, 0x3000]
+
+    maps.close(0x1000)
+    assert maps.contains(0x1800) is None
+    assert maps.contains(0x1800, opened=False).base == 0x1000
+    assert [e.base for e in maps.entries_in(0, 0x10000)] == [0x3000]
+
+
+def test_memory_budget_closes_least_recently_used():
+    maps, evicted = _manager(0x2000, 1 << 20)
+    for i, base in enumerate((0x1000, 0x2000, 0x3000)):
+        maps.add(base, 0x1000, '/tmp/%s' % hex(base), 'r-x', 3 + i)
+    maps.touch(0x1000)
+
+    assert maps.memory_size == 0x3000
+    maps.enforce()
+
+    assert evicted == [(0x2000, 4, False)]
+    assert maps.memory_size == 0x2000
+    assert maps.disk_size == 0x3000
+    # closed, the file is still known
+    assert maps.get(0x2000).fd is None
+
+
+def test_pinned_maps_are_kept():
+    maps, evicted = _manager(0x1000, 1 << 20)
+    maps.add(0x1000, 0x1000, '/tmp/0x1000', 'r-x', 3)
+    maps.add(0x2000, 0x1000, '/tmp/0x2000', 'r-x', 4)
+
+    maps.enforce(pinned=(0x1000,))
+
+    assert evicted == [(0x2000, 4, False)]
+    assert maps.get(0x1000).fd == 3
+
+
+def test_disk_budget_drops_closed_maps():
+    maps, evicted = _manager(0x1000, 0x2000)
+    for i, base in enumerate((0x1000, 0x2000, 0x3000)):
+        maps.add(base, 0x1000, '/tmp/%s' % hex(base), 'r-x', 3 + i)
+
+    maps.enforce()
+
+    # both closed over the memory budget, the oldest one then goes over the disk budget
+    assert evicted == [(0x1000, 3, False), (0x2000, 4, False), (0x1000, None, True)]
+    assert maps.get(0x1000) is None
+    assert maps.disk_size == 0x2000
+    assert maps.memory_size == 0x1000
+
+
+def test_reopened_map_counts_again():
+    maps, evicted = _manager(1 << 20, 1 << 20)
+    maps.add(0x1000, 0x1000, '/tmp/0x1000', 'r-x', 3)
+    maps.close(0x1000)
+    assert maps.memory_size == 0
+
+    maps.add(0x1000, 0x1000, '/tmp/0x1000', 'r-x', 5)
+    assert maps.memory_size == 0x1000
+    assert maps.disk_size == 0x1000
+    assert maps.get(0x1000).fd == 5
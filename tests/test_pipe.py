@@ -0,0 +1,61 @@
+import sys
+import threading
+import time
+
+from subprocess import Popen, PIPE
+
+import pytest
+
+pytest.importorskip('PyQt5')
+pytest.importorskip('dwarf_debugger')
+
+from r2dwarf.src.pipe import R2Pipe, R2PipeTimeout
+
+# answers like radare2 -q0: a nul when ready, then every reply ends with a nul
+FAKE_R2 = r'''
+import sys
+out = sys.stdout.buffer
+out.write(b'\0')
+out.flush()
+for line in sys.stdin.buffer:
+    if line.startswith(b'short'):
+        out.write(b'short\0')
+    elif line.startswith(b'stall'):
+        out.write(b'AAAA')
+    else:
+        out.write(b'A' * 16 + b'\0')
+    out.flush()
+'''
+
+
+@pytest.fixture
+def pipe(tmp_path):
+    script = tmp_path / 'fake_r2.py'
+    script.write_text(FAKE_R2)
+    pipe = R2Pipe.__new__(R2Pipe)
+    pipe.process = Popen([sys.executable, str(script)], stdin=PIPE, stdout=PIPE, bufsize=0)
+    pipe.process.stdout.read(1)
+    pipe._lock = threading.Lock()
+    pipe._deadline = None
+    pipe._running = False
+    yield pipe
+    pipe.process.kill()
+    pipe.process.wait()
+
+
+def test_sized_read(pipe):
+    assert bytes(pipe._execute('pr 16 @ 0x1000', size=16)) == b'A' * 16
+
+
+def test_short_reply_raises_and_keeps_sync(pipe):
+    start_time = time.time()
+    with pytest.raises(R2PipeTimeout):
+        pipe._execute('short', size=16)
+    assert time.time() - start_time < 3
+    assert bytes(pipe._execute('pr 16 @ 0x1000', size=16)) == b'A' * 16
+
+
+def test_incomplete_reply_kills_after_deadline(pipe):
+    with pytest.raises(R2PipeTimeout):
+        pipe._execute('stall', size=16, timeout=1)
+    assert pipe.process.poll() is not None
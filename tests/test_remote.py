@@ -0,0 +1,99 @@
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+from r2dwarf.src.remote import MAX_URL_LENGTH, R2HttpTransport, R2RemoteError
+
+
+# stand-in for the radare2 http server: one reply per connection, then close
+class _R2Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, cmd):
+        self.server.commands.append((self.command, cmd))
+        if cmd.startswith('sleep '):
+            seconds, cmd = cmd[len('sleep '):].split(';', 1)
+            time.sleep(float(seconds))
+        if cmd == 'fail':
+            status, body = 500, b'error'
+        elif cmd == '?V':
+            status, body = 200, b'5.9.0\n'
+        else:
+            status, body = 200, cmd.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def do_GET(self):
+        self._reply(unquote(self.path[len('/cmd/'):]))
+
+    def do_POST(self):
+        self._reply(self.rfile.read(int(self.headers['Content-Length'])).decode('utf8'))
+
+
+@pytest.fixture
+def r2_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _R2Handler)
+    server.commands = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport(r2_server):
+    transport = R2HttpTransport('http://127.0.0.1:%d' % r2_server.server_address[1], timeout=5).open()
+    yield transport
+    transport.close()
+
+
+def test_parallel_results_keep_command_order(transport):
+    # the first commands answer last
+    cmds = ['sleep %.2f;echo %d' % ((4 - i) * .05, i) for i in range(4)]
+    assert transport.cmd_parallel(cmds) == [('echo %d' % i).encode('utf8') for i in range(4)]
+
+
+def test_closed_connections_are_reopened(transport, r2_server):
+    for i in range(6):
+        assert transport.cmd('echo %d' % i) == ('echo %d' % i).encode('utf8')
+    assert len(r2_server.commands) == 7
+
+
+def test_long_commands_are_posted(transport, r2_server):
+    cmd = 'f x @ 0x1000;' * (MAX_URL_LENGTH // 10)
+    assert transport.cmd(cmd) == cmd.encode('utf8')
+    assert r2_server.commands[-1] == ('POST', cmd)
+
+
+def test_error_status_raises(transport):
+    with pytest.raises(R2RemoteError):
+        transport.cmd('fail')
+    # the pool is still usable
+    assert transport.cmd('echo ok') == b'echo ok'
+
+
+def test_parallel_error_raises(transport):
+    with pytest.raises(R2RemoteError):
+        transport.cmd_parallel(['echo 1', 'fail', 'echo 2'])
+
+
+def test_unreachable_server():
+    with pytest.raises(Exception):
+        R2HttpTransport('http://127.0.0.1:1', timeout=1).open()
+
+
+def test_unsupported_scheme():
+    with pytest.raises(R2RemoteError):
+        R2HttpTransport('https://127.0.0.1:9090')
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from r2dwarf.src.sharding import merge_script, merge_shards, shard_ranges
+
+
+def _function(offset, name, blocks):
+    return {'offset': offset, 'name': name, 'blocks': [{'addr': a, 'size': s} for a, s in blocks]}
+
+
+def test_shard_ranges_cover_the_module():
+    shards = shard_ranges(0x10000, 0x10000 + 0x2800, 4)
+    assert shards[0][0] == 0x10000
+    assert shards[-1][1] == 0x12800
+    assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+
+
+def test_merge_drops_tails_of_split_functions():
+    first = ([_function(0x1000, 'fcn.1000', [(0x1000, 0x40), (0x1040, 0x40)])], [])
+    # the second shard starts at 0x1040, in the middle of fcn.1000
+    second = ([_function(0x1040, 'fcn.1040', [(0x1040, 0x40)]),
+               _function(0x2000, 'fcn.2000', [(0x2000, 0x10)])],
+              [{'from': 0x2004, 'to': 0x1000, 'type': 'CALL'}])
+
+    functions, xrefs = merge_shards([second, first])
+
+    assert [f['offset'] for f in functions] == [0x1000, 0x2000]
+    assert xrefs == [{'from': 0x2004, 'to': 0x1000, 'type': 'CALL'}]
+
+
+def test_merge_keeps_called_nested_functions():
+    outer = _function(0x1000, 'fcn.1000', [(0x1000, 0x100)])
+    inner = _function(0x1080, 'fcn.1080', [(0x1080, 0x20)])
+
+    functions, xrefs = merge_shards([([outer], []), ([inner], [{'from': 0x3000, 'to': 0x1080, 'type': 'CALL'}])])
+
+    assert [f['offset'] for f in functions] == [0x1000, 0x1080]
+
+
+def test_merge_script():
+    function = _function(0x1000, 'main', [(0x1000, 0x10)])
+    function['blocks'][0]['jump'] = 0x1020
+    function['blocks'][0]['fail'] = 0x1010
+    xrefs = [{'from': 0x1004, 'to': 0x2000, 'type': 'CALL'},
+             {'from': 0x1008, 'to': 0x3000, 'type': 'DATA'},
+             {'from': 0x100c, 'to': 0x4000, 'type': 'UNKNOWN'}]
+
+    assert merge_script([function], xrefs) == [
+        'af+ 0x1000 main',
+        'afb+ 0x1000 0x1000 16 0x1020 0x1010',
+        'axC 0x2000 0x1004',
+        'axd 0x3000 0x1008',
+    ]
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from r2dwarf.src.strings import R2StringIndex, R2StringStore, scan_strings
+
+
+def test_wide_string_after_ascii_string():
+    data = b'\x90\x90string here\x00' + 'wide!'.encode('utf-16-le') + b'\x00\x00'
+    strings = scan_strings(data, 0x1000)
+    assert (0x1002, 0, 'string here') in strings
+    assert (0x1000 + data.index(b'w\x00'), 1, 'wide!') in strings
+    assert not [s for s in strings if s[2] == 'ewide!']
+
+
+@pytest.mark.parametrize('padding', [b'', b'\x90'])
+def test_wide_string_alignment(padding):
+    data = padding + b'\x00\x00' + 'wide!'.encode('utf-16-le') + b'\x00\x00'
+    assert scan_strings(data, 0) == [(len(padding) + 2, 1, 'wide!')]
+
+
+def test_short_wide_string_after_ascii_string():
+    # once the ascii char is dropped, what is left is too short
+    data = b'abcd\x00' + 'wid'.encode('utf-16-le')
+    assert [s[2] for s in scan_strings(data, 0)] == ['abcd']
+
+
+def test_index_rebased_on_load(tmp_path):
+    store = R2StringStore(str(tmp_path))
+    index = R2StringIndex('libfoo.so', 'key', 0x10000, '/system/lib/libfoo.so')
+    index.build([(0x10010, 0, 'hello world')], {0x10010: [0x10100]})
+    store.add(0x10000, index)
+
+    loaded = store.load(0x20000, 'libfoo.so', '/system/lib/libfoo.so', 'key')
+    assert loaded.get(0)['address'] == 0x20010
+    assert loaded.get(0)['xrefs'] == [0x20100]
+    assert store.load(0x20000, 'libfoo.so', '/system/lib/libfoo.so', 'other key') is None
+
+
+def test_index_files_are_per_path(tmp_path):
+    store = R2StringStore(str(tmp_path))
+    for path in ('/data/app/a/libfoo.so', '/data/app/b/libfoo.so'):
+        index = R2StringIndex('libfoo.so', path, 0, path)
+        index.build([(0x10, 0, path)], {})
+        store.add(0, index)
+
+    assert store.load(0, 'libfoo.so', '/data/app/a/libfoo.so', '/data/app/a/libfoo.so') is not None
+    assert store.load(0, 'libfoo.so', '/data/app/b/libfoo.so', '/data/app/b/libfoo.so') is not None